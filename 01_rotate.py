@@ -1,40 +1,79 @@
 import os
 import json
 import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Tuple
-from PIL import Image, ExifTags
+import piexif
+from PIL import Image
 
 Image.MAX_IMAGE_PIXELS = None
 VALID_EXTS = (".jpg", ".jpeg", ".png")
 
+# EXIF header reads are I/O-bound, so threads overlap them well
+SORT_KEY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# (IFD, tag) in preferred order: DateTimeOriginal -> DateTimeDigitized -> DateTime
+EXIF_DATE_TAGS = (
+    ("Exif", piexif.ExifIFD.DateTimeOriginal),
+    ("Exif", piexif.ExifIFD.DateTimeDigitized),
+    ("0th", piexif.ImageIFD.DateTime),
+)
+EXIF_IFD_POINTER = 0x8769
+
 
 def load_config(config_file: str) -> dict:
     with open(config_file, "r", encoding="utf8") as f:
         return json.load(f)
 
 
+def _exif_date_values(file_path: str) -> List[str]:
+    """
+    Header-only EXIF read via piexif (seeks to APP1, no PIL plugin dispatch).
+    Returns the raw date strings in preferred order; raises if piexif can't parse the file.
+    """
+    exif = piexif.load(file_path)
+    values = []
+    for ifd, tag in EXIF_DATE_TAGS:
+        value = exif.get(ifd, {}).get(tag)
+        if isinstance(value, bytes):
+            value = value.decode("ascii", errors="ignore")
+        values.append(value)
+    return values
+
+
+def _exif_date_values_pil(file_path: str) -> List[str]:
+    with Image.open(file_path) as img:
+        exif = img.getexif()
+        if not exif:
+            return []
+        # DateTimeOriginal/Digitized live in the Exif sub-IFD, DateTime in IFD0
+        exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+        return [exif_ifd.get(0x9003), exif_ifd.get(0x9004), exif.get(0x0132)]
+
+
+@functools.lru_cache(maxsize=None)
 def get_exif_date_taken(file_path: str) -> Optional[datetime]:
     """
     Preferred order:
     DateTimeOriginal -> DateTimeDigitized -> DateTime
     """
     try:
-        img = Image.open(file_path)
-        exif = img._getexif()
-        if not exif:
-            return None
-
-        decoded = {}
-        for tag, value in exif.items():
-            decoded_tag = ExifTags.TAGS.get(tag, tag)
-            decoded[decoded_tag] = value
+        try:
+            values = _exif_date_values(file_path)
+        except Exception:
+            # e.g. PNG or unusual JPEG layout: let Pillow try
+            values = _exif_date_values_pil(file_path)
 
-        for key in ("DateTimeOriginal", "DateTimeDigitized", "DateTime"):
-            value = decoded.get(key)
+        for value in values:
             if value:
+                # EXIF fixes the layout to "YYYY:MM:DD HH:MM:SS"; slicing beats strptime
                 try:
-                    return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+                    return datetime(
+                        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                    )
                 except Exception:
                     pass
     except Exception:
@@ -43,35 +82,37 @@ def get_exif_date_taken(file_path: str) -> Optional[datetime]:
     return None
 
 
-def get_image_sort_key(file_path: str):
+def get_image_sort_key(file_path: str) -> Tuple[datetime, str]:
+    # always (datetime, name): EXIF date, else mtime; undated files go last, by name
+    name = os.path.basename(file_path).lower()
     exif_date = get_exif_date_taken(file_path)
     if exif_date:
-        return exif_date
+        return exif_date, name
     try:
-        return datetime.fromtimestamp(os.path.getmtime(file_path))
+        return datetime.fromtimestamp(os.path.getmtime(file_path)), name
     except Exception:
-        return os.path.basename(file_path).lower()
+        return datetime.max, name
 
 
 def collect_images(folder_path: str) -> List[str]:
     files = []
-    for fn in os.listdir(folder_path):
-        fp = os.path.join(folder_path, fn)
-        if not os.path.isfile(fp):
-            continue
-        fn_l = fn.lower()
-        if not fn_l.endswith(VALID_EXTS):
-            continue
-        # exclude artifacts
-        if "_processed" in fn_l:
-            continue
-        if fn_l.startswith("pdfprep__"):
-            continue
-        files.append(fp)
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            fn_l = entry.name.lower()
+            if not fn_l.endswith(VALID_EXTS):
+                continue
+            # exclude artifacts
+            if "_processed" in fn_l:
+                continue
+            if fn_l.startswith("pdfprep__"):
+                continue
+            files.append(entry.path)
     return files
 
 
-from PIL import Image, ExifTags, ImageOps
+from PIL import Image, ImageOps
 
 
 def suggested_rotation_degrees(image_path: str) -> int:
@@ -101,12 +142,13 @@ def main():
 
     plan_path = os.path.join(output_folder, "rotation_plan.txt")
 
-    lines: List[str] = []
-    lines.append("# rotation plan v1")
-    lines.append("# format: relative_path | rotation_degrees")
-    lines.append("# allowed degrees: 0, 90, 180, 270")
-    lines.append("# edit the degrees manually, then run 02_build_photobook_from_plan.py")
-    lines.append("")
+    header = "\n".join([
+        "# rotation plan v1",
+        "# format: relative_path | rotation_degrees",
+        "# allowed degrees: 0, 90, 180, 270",
+        "# edit the degrees manually, then run 02_build_photobook_from_plan.py",
+        "",
+    ])
 
     # build a stable ordered list across all chapters
     # and store as paths relative to config location (or current working dir)
@@ -114,22 +156,30 @@ def main():
 
     for folder_path, heading, _thumb_rel in config["input_folders"]:
         images = collect_images(folder_path)
-        images_sorted = sorted(images, key=lambda p: (get_image_sort_key(p), os.path.basename(p).lower()))
+        # decorate-sort-undecorate: one sort-key (EXIF) read per image, read in parallel
+        with ThreadPoolExecutor(max_workers=SORT_KEY_WORKERS) as executor:
+            sort_keys = list(executor.map(get_image_sort_key, images))
+        images_sorted = [p for _, p in sorted(zip(sort_keys, images))]
         for p in images_sorted:
             all_items.append((heading, p))
 
-    current_heading = None
-    for heading, abs_path in all_items:
-        if heading != current_heading:
-            lines.append(f"# Chapter: {heading}")
-            current_heading = heading
-
-        rel_path = abs_path.replace("\\", "/")
-        deg = suggested_rotation_degrees(abs_path)
-        lines.append(f"{rel_path} | {deg}")
-
-    with open(plan_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    # stream lines to a temp file; an existing (edited) plan is only replaced once complete
+    tmp_path = plan_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(header)
+        f.write("\n")
+
+        current_heading = None
+        for heading, abs_path in all_items:
+            if heading != current_heading:
+                f.write(f"# Chapter: {heading}\n")
+                current_heading = heading
+
+            rel_path = abs_path if os.sep == "/" else abs_path.replace("\\", "/")
+            deg = suggested_rotation_degrees(abs_path)
+            f.write(f"{rel_path} | {deg}")
+            f.write("\n")
+    os.replace(tmp_path, plan_path)
 
     print(f"Wrote rotation plan: {plan_path}")
     print("Edit that file, then run: 02_build_photobook_from_plan.py <config>")
@@ -1,22 +1,44 @@
 import os
 import json
 import argparse
+import functools
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 
 from fpdf import FPDF
-from PIL import Image, ExifTags
+import imagesize
+import piexif
+from PIL import Image
 from tqdm import tqdm
 
+from gps_lookup import find_corresponding_gps_image
+
 # --- PDF size control ---
 PHOTO_TARGET_DPI = 200          # was effectively ~300
 MAP_TARGET_DPI = 170            # maps can be lower
 PHOTO_JPEG_QUALITY = 72         # 65–80 is typical; lower = smaller
 MAP_JPEG_QUALITY = 70
 
+# Layout assumes cached pixels are placed at 300 dpi
+MM_PER_PX_AT_300 = 25.4 / 300
+
 
 Image.MAX_IMAGE_PIXELS = None
 VALID_EXTS = (".jpg", ".jpeg", ".png")
+VALID_ROTATIONS = frozenset((0, 90, 180, 270))
+
+# EXIF header reads are I/O-bound, so threads overlap them well
+SORT_KEY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# (IFD, tag) in preferred order: DateTimeOriginal -> DateTimeDigitized -> DateTime
+EXIF_DATE_TAGS = (
+    ("Exif", piexif.ExifIFD.DateTimeOriginal),
+    ("Exif", piexif.ExifIFD.DateTimeDigitized),
+    ("0th", piexif.ImageIFD.DateTime),
+)
+EXIF_IFD_POINTER = 0x8769
 
 
 # -------------------------------------------------
@@ -27,23 +49,48 @@ def load_config(config_file: str) -> dict:
         return json.load(f)
 
 
-def get_exif_date_taken(file_path: str) -> Optional[datetime]:
-    try:
-        img = Image.open(file_path)
-        exif = img._getexif()
+def _exif_date_values(file_path: str) -> List[str]:
+    """
+    Header-only EXIF read via piexif (seeks to APP1, no PIL plugin dispatch).
+    Returns the raw date strings in preferred order; raises if piexif can't parse the file.
+    """
+    exif = piexif.load(file_path)
+    values = []
+    for ifd, tag in EXIF_DATE_TAGS:
+        value = exif.get(ifd, {}).get(tag)
+        if isinstance(value, bytes):
+            value = value.decode("ascii", errors="ignore")
+        values.append(value)
+    return values
+
+
+def _exif_date_values_pil(file_path: str) -> List[str]:
+    with Image.open(file_path) as img:
+        exif = img.getexif()
         if not exif:
-            return None
+            return []
+        # DateTimeOriginal/Digitized live in the Exif sub-IFD, DateTime in IFD0
+        exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+        return [exif_ifd.get(0x9003), exif_ifd.get(0x9004), exif.get(0x0132)]
+
 
-        decoded = {}
-        for tag, value in exif.items():
-            decoded_tag = ExifTags.TAGS.get(tag, tag)
-            decoded[decoded_tag] = value
+@functools.lru_cache(maxsize=None)
+def get_exif_date_taken(file_path: str) -> Optional[datetime]:
+    try:
+        try:
+            values = _exif_date_values(file_path)
+        except Exception:
+            # e.g. PNG or unusual JPEG layout: let Pillow try
+            values = _exif_date_values_pil(file_path)
 
-        for key in ("DateTimeOriginal", "DateTimeDigitized", "DateTime"):
-            value = decoded.get(key)
+        for value in values:
             if value:
+                # EXIF fixes the layout to "YYYY:MM:DD HH:MM:SS"; slicing beats strptime
                 try:
-                    return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+                    return datetime(
+                        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                    )
                 except Exception:
                     pass
     except Exception:
@@ -51,31 +98,33 @@ def get_exif_date_taken(file_path: str) -> Optional[datetime]:
     return None
 
 
-def get_image_sort_key(file_path: str):
+def get_image_sort_key(file_path: str) -> Tuple[datetime, str]:
+    # always (datetime, name): EXIF date, else mtime; undated files go last, by name
+    name = os.path.basename(file_path).lower()
     exif_date = get_exif_date_taken(file_path)
     if exif_date:
-        return exif_date
+        return exif_date, name
     try:
-        return datetime.fromtimestamp(os.path.getmtime(file_path))
+        return datetime.fromtimestamp(os.path.getmtime(file_path)), name
     except Exception:
-        return os.path.basename(file_path).lower()
+        return datetime.max, name
 
 
 def collect_images(folder_path: str) -> List[str]:
     files = []
-    for fn in os.listdir(folder_path):
-        fp = os.path.join(folder_path, fn)
-        if not os.path.isfile(fp):
-            continue
-        fn_l = fn.lower()
-        if not fn_l.endswith(VALID_EXTS):
-            continue
-        # exclude artifacts
-        if "_processed" in fn_l:
-            continue
-        if fn_l.startswith("pdfprep__"):
-            continue
-        files.append(fp)
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            fn_l = entry.name.lower()
+            if not fn_l.endswith(VALID_EXTS):
+                continue
+            # exclude artifacts
+            if "_processed" in fn_l:
+                continue
+            if fn_l.startswith("pdfprep__"):
+                continue
+            files.append(entry.path)
     return files
 
 
@@ -83,70 +132,115 @@ def collect_images(folder_path: str) -> List[str]:
 # Rotation plan
 # -------------------------------------------------
 def parse_rotation_plan(plan_path: str) -> Dict[str, int]:
-    mapping: Dict[str, int] = {}
     with open(plan_path, "r", encoding="utf-8") as f:
-        for line in f:
-            s = line.strip()
-            if not s or s.startswith("#"):
-                continue
-            if "|" not in s:
-                continue
-            path_part, deg_part = [x.strip() for x in s.split("|", 1)]
-            deg = int(deg_part)
-            if deg not in (0, 90, 180, 270):
-                raise ValueError(f"Invalid rotation degree '{deg}' in line: {line}")
-            mapping[path_part.replace("\\", "/")] = deg
+        lines = f.read().splitlines()
+
+    to_posix = os.sep != "/"
+    mapping: Dict[str, int] = {}
+    for line in lines:
+        s = line.strip()
+        if not s or s[0] == "#":
+            continue
+        path_part, sep, deg_part = s.partition("|")
+        if not sep:
+            continue
+        deg = int(deg_part)
+        if deg not in VALID_ROTATIONS:
+            raise ValueError(f"Invalid rotation degree '{deg}' in line: {line}")
+        path_part = path_part.strip()
+        mapping[path_part.replace("\\", "/") if to_posix else path_part] = deg
     return mapping
 
 
 # -------------------------------------------------
-# GPS map lookup
+# Caching
 # -------------------------------------------------
-def find_corresponding_gps_image(
-    photo_path: str,
-    gps_folder: Optional[str],
-    mode: str = "stem_contains",
-) -> Optional[str]:
-    if not gps_folder or not os.path.isdir(gps_folder):
-        return None
 
-    stem = os.path.splitext(os.path.basename(photo_path))[0].lower()
 
-    for fn in os.listdir(gps_folder):
-        if not fn.lower().endswith((".png", ".jpg", ".jpeg")):
-            continue
-        name_l = fn.lower()
-        fp = os.path.join(gps_folder, fn)
+from PIL import ImageOps
 
-        if mode == "exact":
-            if os.path.splitext(fn)[0].lower() == stem:
-                return fp
 
-        token = f"__{stem}__map_"
-        if token in name_l:
-            return fp
+from PIL import Image, ImageOps
 
-    if mode != "exact":
-        for fn in os.listdir(gps_folder):
-            if not fn.lower().endswith((".png", ".jpg", ".jpeg")):
-                continue
-            if stem in fn.lower():
-                return os.path.join(gps_folder, fn)
+from PIL import Image, ImageOps
 
-    return None
+# Cache files carry their pixel size: "<key>__w{W}__h{H}.jpg"
+CACHE_SIZE_RE = re.compile(r"__w(\d+)__h(\d+)\.jpg$")
+# Older cache files: "<key>.jpg" (key ends in "__dpi{N}")
+LEGACY_CACHE_RE = re.compile(r"__dpi\d+\.jpg$")
 
 
-# -------------------------------------------------
-# Caching
-# -------------------------------------------------
+@functools.lru_cache(maxsize=None)
+def index_cache_folder(cache_folder: str) -> Dict[str, Tuple[str, int, int]]:
+    """
+    One scandir per cache folder (per process): cache key -> (path, w, h).
+    Sizes come from the filename, so warm re-runs never open the cached JPEGs.
+    """
+    index: Dict[str, Tuple[str, int, int]] = {}
+    with os.scandir(cache_folder) as it:
+        for entry in it:
+            m = CACHE_SIZE_RE.search(entry.name)
+            if m:
+                index[entry.name[: m.start()]] = (entry.path, int(m.group(1)), int(m.group(2)))
+            elif LEGACY_CACHE_RE.search(entry.name):
+                # size from the JPEG SOF marker only (no Pillow, no decode)
+                w, h = imagesize.get(entry.path)
+                if w > 0 and h > 0:
+                    index.setdefault(entry.name[:-4], (entry.path, w, h))
+    return index
+
+
+# EXIF Orientation -> transpose that undoes it (same table as ImageOps.exif_transpose)
+EXIF_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# clockwise degrees -> transpose (ROTATE_* in Pillow are counter-clockwise)
+CW_ROTATION_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+
+
+def fit_oriented(img: Image.Image, rotation_deg_cw: int, max_w: int, max_h: int) -> Image.Image:
+    """
+    EXIF orientation + clockwise rotation + RGB + downscale-to-fit in one resampling pass.
+    The resize runs in source orientation at the final size; the quarter turns after it are
+    lossless transposes on the small image. Never upscales (same as thumbnail()).
+    """
+    orientation = img.getexif().get(0x0112, 1)
+    swap = (rotation_deg_cw // 90 + (1 if orientation in (5, 6, 7, 8) else 0)) % 2 == 1
 
+    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale; the box is in source orientation
+    # so the decoded image still covers the final target size (no-op for non-JPEG).
+    img.draft("RGB", (max_h, max_w) if swap else (max_w, max_h))
 
-from PIL import ImageOps
+    if img.mode != "RGB":
+        img = img.convert("RGB")
 
+    src_w, src_h = img.size
+    out_w, out_h = (src_h, src_w) if swap else (src_w, src_h)
+    scale = min(max_w / out_w, max_h / out_h)
+    if scale < 1:
+        size = (max(1, round(src_w * scale)), max(1, round(src_h * scale)))
+        img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
 
-from PIL import Image, ImageOps
+    method = EXIF_ORIENTATION_TRANSPOSE.get(orientation)
+    if method is not None:
+        img = img.transpose(method)
+
+    method = CW_ROTATION_TRANSPOSE.get(rotation_deg_cw % 360)
+    if method is not None:
+        img = img.transpose(method)
+
+    return img
 
-from PIL import Image, ImageOps
 
 def process_photo_to_cache(
     src_path: str,
@@ -156,41 +250,36 @@ def process_photo_to_cache(
     os.makedirs(cache_folder, exist_ok=True)
 
     base = os.path.splitext(os.path.basename(src_path))[0]
-    out_path = os.path.join(
-        cache_folder,
-        f"{base}__rot{rotation_deg_cw}__q{PHOTO_JPEG_QUALITY}__dpi{PHOTO_TARGET_DPI}.jpg",
-    )
+    key = f"{base}__rot{rotation_deg_cw}__q{PHOTO_JPEG_QUALITY}__dpi{PHOTO_TARGET_DPI}"
 
-    if os.path.exists(out_path):
-        with Image.open(out_path) as im:
-            return out_path, im.size[0], im.size[1]
+    cache_index = index_cache_folder(cache_folder)
+    if key in cache_index:
+        return cache_index[key]
 
     # A4 @ target dpi (portrait)
     max_w = int(round(8.27 * PHOTO_TARGET_DPI))   # 210mm / 25.4
     max_h = int(round(11.69 * PHOTO_TARGET_DPI))  # 297mm / 25.4
 
     with Image.open(src_path) as img:
-        img = ImageOps.exif_transpose(img)
-
-        if rotation_deg_cw % 360 != 0:
-            img = img.rotate(-rotation_deg_cw, expand=True)
-
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
         # IMPORTANT: no upscaling, only downscale
-        img.thumbnail((max_w, max_h), Image.LANCZOS)
+        img = fit_oriented(img, rotation_deg_cw, max_w, max_h)
         w2, h2 = img.size
+        out_path = os.path.join(cache_folder, f"{key}__w{w2}__h{h2}.jpg")
+        # pool workers can miss the same key at once: write a per-process temp file and rename it
+        # into place, so the cache index never sees a half-written JPEG
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
 
         img.save(
-            out_path,
+            tmp_path,
             "JPEG",
             quality=PHOTO_JPEG_QUALITY,
             optimize=True,
             progressive=True,
             subsampling=2,  # 4:2:0 chroma subsampling (smaller)
         )
+    os.replace(tmp_path, out_path)
 
+    cache_index[key] = (out_path, w2, h2)
     return out_path, w2, h2
 
 
@@ -202,62 +291,87 @@ def process_map_to_cache(
     os.makedirs(cache_folder, exist_ok=True)
 
     base = os.path.splitext(os.path.basename(map_path))[0]
-    out_path = os.path.join(
-        cache_folder,
-        f"{base}__mapcache_rot{rotate_deg_cw}__q{MAP_JPEG_QUALITY}__dpi{MAP_TARGET_DPI}.jpg",
-    )
+    key = f"{base}__mapcache_rot{rotate_deg_cw}__q{MAP_JPEG_QUALITY}__dpi{MAP_TARGET_DPI}"
 
-    if os.path.exists(out_path):
-        with Image.open(out_path) as im:
-            return out_path, im.size[0], im.size[1]
+    cache_index = index_cache_folder(cache_folder)
+    if key in cache_index:
+        return cache_index[key]
 
     # A4 width at target dpi, but short height (banner)
     max_w = int(round(8.27 * MAP_TARGET_DPI))
     max_h = int(round(2.2 * MAP_TARGET_DPI))  # banner height ~2.2 inches; tune as needed
 
     with Image.open(map_path) as img:
-        img = ImageOps.exif_transpose(img)
-
-        if rotate_deg_cw % 360 != 0:
-            img = img.rotate(-rotate_deg_cw, expand=True)
-
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
-        img.thumbnail((max_w, max_h), Image.LANCZOS)
+        img = fit_oriented(img, rotate_deg_cw, max_w, max_h)
         w2, h2 = img.size
+        out_path = os.path.join(cache_folder, f"{key}__w{w2}__h{h2}.jpg")
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
 
         img.save(
-            out_path,
+            tmp_path,
             "JPEG",
             quality=MAP_JPEG_QUALITY,
             optimize=True,
             progressive=True,
             subsampling=2,
         )
+    os.replace(tmp_path, out_path)
 
+    cache_index[key] = (out_path, w2, h2)
     return out_path, w2, h2
 
 
 
+def cache_page_images(job: Tuple[str, int, Optional[str], str, str]):
+    """
+    Process-pool worker: caches one page's photo and (optional) map.
+    Returns (photo_cached, pw_px, ph_px, gps_cached, mw_px, mh_px).
+    """
+    src_path, deg, gps_path, resized_folder, map_cache_folder = job
+
+    photo_cached, pw_px, ph_px = process_photo_to_cache(src_path, resized_folder, deg)
+
+    gps_cached = None
+    mw_px = mh_px = None
+    if gps_path:
+        gps_cached, mw_px, mh_px = process_map_to_cache(gps_path, map_cache_folder)
+
+    return photo_cached, pw_px, ph_px, gps_cached, mw_px, mh_px
+
+
 def process_image_for_pdf(image_path: str, temp_folder: str, max_width_mm: float, max_height_mm: float):
     """
-    Preps title/chapter thumbnails; writes into out/PDF_Temp (never next to source).
+    Preps title/chapter thumbnails. fpdf embeds JPEG/PNG as-is, so the original path is
+    returned unless EXIF orientation requires a rotated copy (written to out/PDF_Temp,
+    never next to source).
     """
-    os.makedirs(temp_folder, exist_ok=True)
-    img = Image.open(image_path)
     dpi = 300
+    tgt_px = (int(max_width_mm / 25.4 * dpi), int(max_height_mm / 25.4 * dpi))
 
-    img_width_mm = img.width * 25.4 / dpi
-    img_height_mm = img.height * 25.4 / dpi
+    with Image.open(image_path) as img:
+        processed = image_path
+        width, height = img.size
+
+        # Header-only unless a rotation (or unsupported format) forces a re-encode
+        if img.getexif().get(0x0112, 1) != 1 or img.format not in ("JPEG", "PNG"):
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            # re-encoding anyway: keep no more pixels than the box holds at 300 dpi
+            img.thumbnail(tgt_px, Image.LANCZOS)
+            width, height = img.size
+
+            os.makedirs(temp_folder, exist_ok=True)
+            processed = os.path.join(temp_folder, f"pdfprep__{os.path.basename(image_path)}")
+            img.save(processed, "JPEG")
+
+    img_width_mm = width * 25.4 / dpi
+    img_height_mm = height * 25.4 / dpi
 
     scale = min(max_width_mm / img_width_mm, max_height_mm / img_height_mm)
     img_width_mm *= scale
     img_height_mm *= scale
 
-    processed = os.path.join(temp_folder, f"pdfprep__{os.path.basename(image_path)}")
-    img.save(processed, "JPEG")
-
     return img_width_mm, img_height_mm, processed
 
 
@@ -355,57 +469,80 @@ def main():
     if photo_area_h <= 50:
         raise RuntimeError("Layout too tight: increase page margins or reduce map_max_h.")
 
+    # Per-page constants (hoisted out of the page loop)
+    half_usable_w = usable_w * 0.5
+    map_y_top = margin_y
+    photo_y_top = margin_y + map_area_h + gutter_y
+
     #enhanced_title_page(pdf, config, pdf_temp_folder)
 
+    # Collect every page first so image caching can run in parallel
+    chapters = []
+    jobs = []
     for folder_path, heading, thumb_rel in config["input_folders"]:
         chapter_thumb = os.path.join(folder_path, thumb_rel) if thumb_rel else None
-        chapter_page(pdf, heading, chapter_thumb, pdf_temp_folder)
 
         images = collect_images(folder_path)
-        images_sorted = sorted(images, key=lambda p: (get_image_sort_key(p), os.path.basename(p).lower()))
+        # decorate-sort-undecorate: one sort-key (EXIF) read per image, read in parallel
+        with ThreadPoolExecutor(max_workers=SORT_KEY_WORKERS) as executor:
+            sort_keys = list(executor.map(get_image_sort_key, images))
+        images_sorted = [p for _, p in sorted(zip(sort_keys, images))]
 
-        for src_path in tqdm(images_sorted, desc=f"Pages: {heading}", unit="page"):
-            rel = src_path.replace("\\", "/")
+        for src_path in images_sorted:
+            rel = src_path if os.sep == "/" else src_path.replace("\\", "/")
             if rel not in rotations:
                 raise KeyError(f"Missing rotation entry for: {rel}  (edit {plan_path})")
 
-            deg = rotations[rel]
+            gps_path = find_corresponding_gps_image(src_path, gps_folder, mode=gps_match)
 
-            # Cache rotated/resized photo
-            photo_cached, pw_px, ph_px = process_photo_to_cache(src_path, resized_folder, deg)
+            jobs.append((src_path, rotations[rel], gps_path, resized_folder, map_cache_folder))
 
-            # Find + cache map
-            gps_path = find_corresponding_gps_image(src_path, gps_folder, mode=gps_match)
-            gps_cached = None
-            mw_px = mh_px = None
-            if gps_path and os.path.isfile(gps_path):
-                gps_cached, mw_px, mh_px = process_map_to_cache(gps_path, map_cache_folder)
+        chapters.append((heading, chapter_thumb, len(images_sorted)))
+
+    # Decode/resize/encode is CPU-bound; existing cache files still short-circuit in the workers
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        pages = list(
+            tqdm(
+                executor.map(cache_page_images, jobs, chunksize=8),
+                total=len(jobs),
+                desc="Caching images",
+                unit="page",
+            )
+        )
+
+    # fpdf is single-threaded: layout only from here on
+    page_iter = iter(pages)
+    for heading, chapter_thumb, n_pages in chapters:
+        chapter_page(pdf, heading, chapter_thumb, pdf_temp_folder)
+
+        for _ in range(n_pages):
+            photo_cached, pw_px, ph_px, gps_cached, mw_px, mh_px = next(page_iter)
 
             pdf.add_page()
 
             # --- MAP (top, full width, bounded height) ---
             if gps_cached and mw_px and mh_px:
-                map_w_mm = mw_px * 25.4 / 300
-                map_h_mm = mh_px * 25.4 / 300
+                map_w_mm = mw_px * MM_PER_PX_AT_300
+                map_h_mm = mh_px * MM_PER_PX_AT_300
 
                 scale_map = min(usable_w / map_w_mm, map_area_h / map_h_mm)
                 w_map = map_w_mm * scale_map
                 h_map = map_h_mm * scale_map
 
-                x_map = margin_x + (usable_w - w_map) / 2
-                y_map = margin_y + (map_area_h - h_map) / 2
+                x_map = margin_x + half_usable_w - w_map * 0.5
+                y_map = map_y_top + (map_area_h - h_map) * 0.5
                 pdf.image(gps_cached, x=x_map, y=y_map, w=w_map, h=h_map)
 
             # --- PHOTO (below map, uses remaining height) ---
-            photo_w_mm = pw_px * 25.4 / 300
-            photo_h_mm = ph_px * 25.4 / 300
+            photo_w_mm = pw_px * MM_PER_PX_AT_300
+            photo_h_mm = ph_px * MM_PER_PX_AT_300
 
             scale_photo = min(usable_w / photo_w_mm, photo_area_h / photo_h_mm)
             w_photo = photo_w_mm * scale_photo
             h_photo = photo_h_mm * scale_photo
 
-            x_photo = margin_x + (usable_w - w_photo) / 2
-            y_photo = margin_y + map_area_h + gutter_y + (photo_area_h - h_photo) / 2
+            x_photo = margin_x + half_usable_w - w_photo * 0.5
+            y_photo = photo_y_top + (photo_area_h - h_photo) * 0.5
             pdf.image(photo_cached, x=x_photo, y=y_photo, w=w_photo, h=h_photo)
 
     pdf.output(output_pdf)
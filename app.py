@@ -4,9 +4,10 @@ import sqlite3
 import hashlib
 import shutil
 from pathlib import Path
+from stat import S_ISREG
 from typing import Iterable, List, Optional, Tuple
 
-from flask import Flask, render_template, request, redirect, url_for, send_file, abort, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, send_file, abort, jsonify, flash, g
 
 APP_DIR = Path(__file__).resolve().parent
 DB_PATH = APP_DIR / "app.db"
@@ -20,21 +21,62 @@ IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".tif", ".tiff", ".bmp"}
 # If True, hidden files/dirs (starting with .) are skipped
 SKIP_HIDDEN = True
 
+# Browser cache lifetime (seconds) for served originals; revalidated via ETag/Last-Modified
+IMAGE_MAX_AGE = 3600
+
+# Characters not allowed in copy filenames
+_SANITIZE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
 app = Flask(__name__)
 app.secret_key = "dev-secret-change-me"  # set a real secret for production
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = IMAGE_MAX_AGE
 
 
 # -----------------------------
 # Database helpers
 # -----------------------------
-def db() -> sqlite3.Connection:
+def connect() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # per-connection setting: with WAL, NORMAL skips the fsync on every commit
+    conn.execute("PRAGMA synchronous=NORMAL;")
     return conn
 
 
+def db() -> sqlite3.Connection:
+    """
+    Request-scoped connection: opened on first use, closed on app context teardown.
+    """
+    if "db" not in g:
+        g.db = connect()
+    return g.db
+
+
+@app.teardown_appcontext
+def close_db(exc: Optional[BaseException]) -> None:
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.close()
+
+
+def image_counts(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    Returns (total, good) from a single conditional-aggregation query.
+    """
+    row = conn.execute(
+        """
+        SELECT COUNT(*) AS total, COALESCE(SUM(CASE WHEN good = 1 THEN 1 ELSE 0 END), 0) AS good
+        FROM images
+        """
+    ).fetchone()
+    return row["total"], row["good"]
+
+
 def init_db() -> None:
-    with db() as conn:
+    conn = connect()
+    with conn:
+        # WAL persists in the database file: readers don't block the scan
+        conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS images (
@@ -55,6 +97,7 @@ def init_db() -> None:
             CREATE INDEX IF NOT EXISTS idx_images_good ON images(good);
             """
         )
+    conn.close()
 
 
 # -----------------------------
@@ -66,28 +109,47 @@ def is_hidden_path(p: Path) -> bool:
     return any(part.startswith(".") for part in p.parts)
 
 
-def iter_images_in_roots(roots: Iterable[Path]) -> Iterable[Tuple[Path, Path, Path]]:
+def iter_images_in_roots(roots: Iterable[Path]) -> Iterable[Tuple[Path, Path, Path, os.stat_result]]:
     """
-    Yields (root, file_path, relpath_to_root) for image files under roots.
+    Yields (root, file_path, relpath_to_root, stat) for image files under roots.
+    Walks with os.scandir so file type checks and stat come from the directory entries.
     """
     for root in roots:
         if not root.exists() or not root.is_dir():
             continue
+        if is_hidden_path(root):
+            continue
 
-        for file_path in root.rglob("*"):
-            if not file_path.is_file():
-                continue
-            if is_hidden_path(file_path):
+        root_str = str(root)
+        stack = [root_str]
+        while stack:
+            current = stack.pop()
+            try:
+                it = os.scandir(current)
+            except OSError:
                 continue
-
-            ext = file_path.suffix.lower()
-            if ext in IMAGE_EXTS:
-                try:
-                    rel = file_path.relative_to(root)
-                except ValueError:
-                    # Shouldn't happen with rglob, but safe-guard.
-                    rel = file_path.name
-                yield root, file_path, Path(rel)
+            with it:
+                for entry in it:
+                    if SKIP_HIDDEN and entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext not in IMAGE_EXTS:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    rel = os.path.relpath(entry.path, root_str)
+                    yield root, Path(entry.path), Path(rel), stat
 
 
 def stable_copy_name(root: str, relpath: str, original_name: str) -> str:
@@ -96,9 +158,9 @@ def stable_copy_name(root: str, relpath: str, original_name: str) -> str:
     Keeps original basename for human readability, with a short hash prefix.
     """
     key = f"{root}::{relpath}"
-    h = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    h = hashlib.blake2b(key.encode("utf-8"), digest_size=5).hexdigest()
     # sanitize original_name a bit for filesystem
-    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", original_name).strip("_")
+    safe_name = _SANITIZE_RE.sub("_", original_name).strip("_")
     if not safe_name:
         safe_name = "image"
     return f"{h}__{safe_name}"
@@ -115,42 +177,46 @@ def upsert_scan(roots: List[Path]) -> int:
     """
     ensure_good_output_dir()
 
-    added = 0
+    inserts: List[Tuple[str, str, str, str, int, float]] = []
+    updates: List[Tuple[int, float, str]] = []
     with db() as conn:
-        for root, file_path, rel in iter_images_in_roots(roots):
-            try:
-                stat = file_path.stat()
-            except OSError:
-                continue
+        existing = {r["path"] for r in conn.execute("SELECT path FROM images")}
 
-            row = conn.execute("SELECT id FROM images WHERE path = ?", (str(file_path),)).fetchone()
-            if row is None:
-                conn.execute(
-                    """
-                    INSERT INTO images (path, root, relpath, ext, size_bytes, mtime, good, good_copy_path)
-                    VALUES (?, ?, ?, ?, ?, ?, 0, NULL)
-                    """,
+        for root, file_path, rel, stat in iter_images_in_roots(roots):
+            path = str(file_path)
+            if path not in existing:
+                inserts.append(
                     (
-                        str(file_path),
+                        path,
                         str(root),
                         str(rel),
                         file_path.suffix.lower(),
                         int(stat.st_size),
                         float(stat.st_mtime),
-                    ),
+                    )
                 )
-                added += 1
+                # Overlapping roots may yield the same file twice
+                existing.add(path)
             else:
                 # Update size/mtime in case file changed (but do not change good state)
-                conn.execute(
-                    """
-                    UPDATE images
-                    SET size_bytes = ?, mtime = ?
-                    WHERE path = ?
-                    """,
-                    (int(stat.st_size), float(stat.st_mtime), str(file_path)),
-                )
-    return added
+                updates.append((int(stat.st_size), float(stat.st_mtime), path))
+
+        conn.executemany(
+            """
+            INSERT INTO images (path, root, relpath, ext, size_bytes, mtime, good, good_copy_path)
+            VALUES (?, ?, ?, ?, ?, ?, 0, NULL)
+            """,
+            inserts,
+        )
+        conn.executemany(
+            """
+            UPDATE images
+            SET size_bytes = ?, mtime = ?
+            WHERE path = ?
+            """,
+            updates,
+        )
+    return len(inserts)
 
 
 # -----------------------------
@@ -188,12 +254,15 @@ def remove_good_copy(copy_path: Optional[str]) -> None:
         pass
 
 
+# Schema setup runs once per process, not per request
+init_db()
+
+
 # -----------------------------
 # Routes
 # -----------------------------
 @app.route("/", methods=["GET", "POST"])
 def index():
-    init_db()
     ensure_good_output_dir()
 
     if request.method == "POST":
@@ -215,39 +284,64 @@ def index():
 
     # Stats
     with db() as conn:
-        total = conn.execute("SELECT COUNT(*) AS c FROM images").fetchone()["c"]
-        good = conn.execute("SELECT COUNT(*) AS c FROM images WHERE good = 1").fetchone()["c"]
+        total, good = image_counts(conn)
 
     return render_template("index.html", total=total, good=good, output_dir=str(GOOD_OUTPUT_DIR))
 
 
 @app.route("/review/<int:idx>")
 def review(idx: int):
-    init_db()
+    # Prev/next pass the current image id so the neighbour is an index seek on path
+    after_id = request.args.get("after", type=int)
+    before_id = request.args.get("before", type=int)
 
     with db() as conn:
-        total = conn.execute("SELECT COUNT(*) AS c FROM images").fetchone()["c"]
+        total, good_count = image_counts(conn)
         if total == 0:
             flash("No images in database yet. Add folders on the home page.", "error")
             return redirect(url_for("index"))
 
         idx = max(0, min(idx, total - 1))
 
-        row = conn.execute(
-            """
-            SELECT id, path, root, relpath, good, good_copy_path, size_bytes, mtime
-            FROM images
-            ORDER BY path ASC
-            LIMIT 1 OFFSET ?
-            """,
-            (idx,),
-        ).fetchone()
+        row = None
+        if after_id is not None:
+            row = conn.execute(
+                """
+                SELECT id, path, root, relpath, good, good_copy_path, size_bytes, mtime
+                FROM images
+                WHERE path > (SELECT path FROM images WHERE id = ?)
+                ORDER BY path ASC
+                LIMIT 1
+                """,
+                (after_id,),
+            ).fetchone()
+        elif before_id is not None:
+            row = conn.execute(
+                """
+                SELECT id, path, root, relpath, good, good_copy_path, size_bytes, mtime
+                FROM images
+                WHERE path < (SELECT path FROM images WHERE id = ?)
+                ORDER BY path DESC
+                LIMIT 1
+                """,
+                (before_id,),
+            ).fetchone()
+
+        # Direct jumps (and running off either end) fall back to OFFSET
+        if row is None:
+            row = conn.execute(
+                """
+                SELECT id, path, root, relpath, good, good_copy_path, size_bytes, mtime
+                FROM images
+                ORDER BY path ASC
+                LIMIT 1 OFFSET ?
+                """,
+                (idx,),
+            ).fetchone()
 
         if row is None:
             abort(404)
 
-        good_count = conn.execute("SELECT COUNT(*) AS c FROM images WHERE good = 1").fetchone()["c"]
-
     return render_template(
         "review.html",
         row=row,
@@ -259,23 +353,26 @@ def review(idx: int):
 
 @app.route("/image/<int:image_id>")
 def serve_image(image_id: int):
-    init_db()
     with db() as conn:
         row = conn.execute("SELECT path FROM images WHERE id = ?", (image_id,)).fetchone()
     if row is None:
         abort(404)
 
     p = Path(row["path"])
-    if not p.exists() or not p.is_file():
+    try:
+        st = p.stat()
+    except OSError:
+        abort(404)
+    if not S_ISREG(st.st_mode):
         abort(404)
 
     # Sends the original image for viewing; does not modify it.
-    return send_file(p)
+    # Conditional + ETag so prev/next bounces get 304s instead of the full file.
+    return send_file(p, conditional=True, etag=True, last_modified=st.st_mtime, max_age=IMAGE_MAX_AGE)
 
 
 @app.route("/toggle_good", methods=["POST"])
 def toggle_good():
-    init_db()
     data = request.get_json(force=True, silent=True) or {}
     image_id = data.get("image_id")
     make_good = data.get("good")
@@ -321,7 +418,6 @@ def toggle_good():
 
 @app.route("/good")
 def list_good():
-    init_db()
     with db() as conn:
         rows = conn.execute(
             """
@@ -335,6 +431,5 @@ def list_good():
 
 
 if __name__ == "__main__":
-    init_db()
     ensure_good_output_dir()
     app.run(host="0.0.0.0", port=5000, debug=True)
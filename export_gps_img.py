@@ -3,15 +3,24 @@ from __future__ import annotations
 
 import argparse
 import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from PIL import Image, ExifTags
+import piexif
+from PIL import Image, ImageDraw, ExifTags
 from staticmap import StaticMap, CircleMarker, Line
 
 GPSINFO_TAG = 34853  # EXIF tag ID for "GPSInfo"
+EXIF_IFD_POINTER = 0x8769  # DateTimeOriginal (0x9003) lives in this sub-IFD, not IFD0
+TILE_SIZE = 256
+LINE_COLOR, LINE_WIDTH = "#1f77b4", 3  # blue tour line
+MARKER_COLOR, MARKER_WIDTH = "#d62728", 12  # red photo marker
 
 
 @dataclass
@@ -23,20 +32,18 @@ class PhotoPoint:
 
 
 def _to_float(x: Any) -> float:
+    # piexif yields (num, den) int pairs: handle them directly instead of via a TypeError
+    if type(x) is tuple and len(x) == 2:
+        num, den = x
+        return num / den if den else float("nan")
     try:
         return float(x)
     except Exception:
-        if isinstance(x, tuple) and len(x) == 2:
-            num, den = x
-            return float(num) / float(den) if den else float("nan")
         return float("nan")
 
 
 def _dms_to_decimal(dms: Any, ref: str) -> float:
-    deg = _to_float(dms[0])
-    minute = _to_float(dms[1])
-    sec = _to_float(dms[2])
-    dec = deg + (minute / 60.0) + (sec / 3600.0)
+    dec = _to_float(dms[0]) + _to_float(dms[1]) / 60.0 + _to_float(dms[2]) / 3600.0
     if ref in ("S", "W"):
         dec = -dec
     return dec
@@ -51,13 +58,59 @@ def _parse_exif_datetime(s: Any) -> Optional[datetime]:
         return None
 
 
+def _exif_str(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="ignore").rstrip("\x00")
+    return value
+
+
+def _to_decimal_coords(
+    dt: Optional[datetime], lat: Any, lat_ref: Any, lon: Any, lon_ref: Any
+) -> Tuple[Optional[datetime], Optional[float], Optional[float]]:
+    if not (lat and lat_ref and lon and lon_ref):
+        return dt, None, None
+
+    lat_dd = _dms_to_decimal(lat, str(lat_ref))
+    lon_dd = _dms_to_decimal(lon, str(lon_ref))
+
+    if math.isnan(lat_dd) or math.isnan(lon_dd):
+        return dt, None, None
+
+    return dt, lat_dd, lon_dd
+
+
 def extract_gps_and_dt(image_path: Path) -> Tuple[Optional[datetime], Optional[float], Optional[float]]:
+    """
+    Header-only EXIF read via piexif: seeks to the APP1 segment, never sets up pixel decoding.
+    Falls back to Pillow for files piexif can't parse.
+    """
+    try:
+        exif = piexif.load(str(image_path))
+    except Exception:
+        return _extract_gps_and_dt_pil(image_path)
+
+    dt = _parse_exif_datetime(_exif_str(exif["Exif"].get(piexif.ExifIFD.DateTimeOriginal)))
+    if dt is None:
+        dt = _parse_exif_datetime(_exif_str(exif["0th"].get(piexif.ImageIFD.DateTime)))
+
+    gps = exif["GPS"]
+    return _to_decimal_coords(
+        dt,
+        gps.get(piexif.GPSIFD.GPSLatitude),
+        _exif_str(gps.get(piexif.GPSIFD.GPSLatitudeRef)),
+        gps.get(piexif.GPSIFD.GPSLongitude),
+        _exif_str(gps.get(piexif.GPSIFD.GPSLongitudeRef)),
+    )
+
+
+def _extract_gps_and_dt_pil(image_path: Path) -> Tuple[Optional[datetime], Optional[float], Optional[float]]:
     with Image.open(image_path) as img:
         exif = img.getexif()
         if not exif:
             return None, None, None
 
-        dt = _parse_exif_datetime(exif.get(36867)) or _parse_exif_datetime(exif.get(306))
+        # same tags as the piexif path: Exif sub-IFD DateTimeOriginal, else IFD0 DateTime
+        dt = _parse_exif_datetime(exif.get_ifd(EXIF_IFD_POINTER).get(0x9003)) or _parse_exif_datetime(exif.get(306))
 
         try:
             gps_ifd = exif.get_ifd(GPSINFO_TAG)
@@ -69,53 +122,74 @@ def extract_gps_and_dt(image_path: Path) -> Tuple[Optional[datetime], Optional[f
 
         gps: Dict[str, Any] = {ExifTags.GPSTAGS.get(k, k): v for k, v in gps_ifd.items()}
 
-        lat = gps.get("GPSLatitude")
-        lat_ref = gps.get("GPSLatitudeRef")
-        lon = gps.get("GPSLongitude")
-        lon_ref = gps.get("GPSLongitudeRef")
+        return _to_decimal_coords(
+            dt, gps.get("GPSLatitude"), gps.get("GPSLatitudeRef"), gps.get("GPSLongitude"), gps.get("GPSLongitudeRef")
+        )
 
-        if not (lat and lat_ref and lon and lon_ref):
-            return dt, None, None
 
-        lat_dd = _dms_to_decimal(lat, str(lat_ref))
-        lon_dd = _dms_to_decimal(lon, str(lon_ref))
+JPEG_EXTS = (".jpg", ".jpeg")
 
-        if math.isnan(lat_dd) or math.isnan(lon_dd):
-            return dt, None, None
 
-        return dt, lat_dd, lon_dd
+def walk_ext(root: Path, exts: Tuple[str, ...]) -> Iterable[Path]:
+    """
+    Recursively yield files under root whose lowercased name ends with one of exts
+    (unreadable directories are skipped).
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(exts) and entry.is_file():
+                    yield Path(entry.path)
 
 
 def iter_images(folder: Path, recursive: bool) -> Iterable[Path]:
-    exts = {".jpg", ".jpeg", ".JPG", ".JPEG"}
-
     def is_skipped(p: Path) -> bool:
         name = p.name.upper()
         # Skip panoramas and burst shots
         return name.startswith("PANO_") or "BURST" in name
 
     if recursive:
-        for p in folder.rglob("*"):
-            if p.is_file() and p.suffix in exts and not is_skipped(p):
+        for p in walk_ext(folder, JPEG_EXTS):
+            if not is_skipped(p):
                 yield p
     else:
-        for p in folder.iterdir():
-            if p.is_file() and p.suffix in exts and not is_skipped(p):
-                yield p
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name.lower().endswith(JPEG_EXTS) and entry.is_file():
+                    p = Path(entry.path)
+                    if not is_skipped(p):
+                        yield p
 
 
+def _try_extract_gps_and_dt(image_path: Path) -> Optional[Tuple[Optional[datetime], Optional[float], Optional[float]]]:
+    try:
+        return extract_gps_and_dt(image_path)
+    except Exception:
+        return None
+
 
 def collect_points(folder: Path, recursive: bool) -> Tuple[List[PhotoPoint], int]:
     points: List[PhotoPoint] = []
     skipped = 0
 
-    for img_path in iter_images(folder, recursive):
-        try:
-            dt, lat, lon = extract_gps_and_dt(img_path)
-        except Exception:
+    # EXIF reads are I/O + parse bound; overlap the per-file open latency
+    paths = list(iter_images(folder, recursive))
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as ex:
+        results = list(ex.map(_try_extract_gps_and_dt, paths))
+
+    for img_path, result in zip(paths, results):
+        if result is None:
             skipped += 1
             continue
 
+        dt, lat, lon = result
         if dt is None or lat is None or lon is None:
             skipped += 1
             continue
@@ -139,6 +213,34 @@ def safe_stem(p: Path) -> str:
     return "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in s)
 
 
+# Tiles shared by all renders of this run: neighbouring photos (and every photo in --center tour
+# mode) mostly need the same tiles, so each one is only downloaded once. LRU-bounded so a long
+# run over a large area doesn't keep every tile in memory (~20-40 KB per 256 px PNG tile).
+TILE_CACHE_MAX = 2048
+_TILE_CACHE: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+_TILE_CACHE_LOCK = threading.Lock()
+
+
+class CachedStaticMap(StaticMap):
+    """StaticMap whose tile downloads (StaticMap.get) go through the shared in-memory tile cache."""
+
+    def get(self, url: str, **kwargs: Any) -> Tuple[int, bytes]:
+        with _TILE_CACHE_LOCK:
+            hit = _TILE_CACHE.get(url)
+            if hit is not None:
+                _TILE_CACHE.move_to_end(url)
+        if hit is not None:
+            return hit
+
+        status_code, content = super().get(url, **kwargs)
+        if status_code == 200:
+            with _TILE_CACHE_LOCK:
+                _TILE_CACHE[url] = (status_code, content)
+                if len(_TILE_CACHE) > TILE_CACHE_MAX:
+                    _TILE_CACHE.popitem(last=False)
+        return status_code, content
+
+
 def render_map_image(
     out_path: Path,
     center_lat: float,
@@ -155,22 +257,99 @@ def render_map_image(
 
     width_px/height_px let you make portrait or landscape maps.
     """
-    m = StaticMap(width_px, height_px, url_template="https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+    m = CachedStaticMap(width_px, height_px, url_template="https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
 
     # Tour polyline (optional)
     if draw_line and tour_coords and len(tour_coords) >= 2:
-        line = Line([(lon, lat) for lat, lon in tour_coords], "#1f77b4", 3)  # blue
+        line = Line([(lon, lat) for lat, lon in tour_coords], LINE_COLOR, LINE_WIDTH)
         m.add_line(line)
 
     # Marker for this photo
     lat, lon = point_coords
-    marker = CircleMarker((lon, lat), "#d62728", 12)  # red
+    marker = CircleMarker((lon, lat), MARKER_COLOR, MARKER_WIDTH)
     m.add_marker(marker)
 
     img = m.render(zoom=zoom, center=(center_lon, center_lat))
     img.save(out_path)
 
 
+def _lon_to_x(lon: float, zoom: int) -> float:
+    # Web Mercator, in tile units (same projection staticmap uses)
+    return (lon + 180.0) / 360.0 * (2 ** zoom)
+
+
+def _lat_to_y(lat: float, zoom: int) -> float:
+    lat_rad = math.radians(lat)
+    return (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * (2 ** zoom)
+
+
+def simplify_track(coords: List[Tuple[float, float]], zoom: int) -> Tuple[List[Tuple[float, float]], List[int]]:
+    """
+    Projects the track once and drops consecutive points that land on the same pixel of
+    staticmap's 2x drawing canvas at this zoom, so every render draws (and re-projects) far
+    fewer vertices with no visible difference.
+
+    Returns (kept coords, kept_upto) where kept_upto[i] is the number of kept points among
+    coords[: i + 1], i.e. kept[: kept_upto[i]] is the simplified track up to photo i.
+    """
+    scale = TILE_SIZE * 2
+    kept: List[Tuple[float, float]] = []
+    kept_upto: List[int] = []
+    last_px = None
+    for lat, lon in coords:
+        px = (int(_lon_to_x(lon, zoom) * scale), int(_lat_to_y(lat, zoom) * scale))
+        if px != last_px:
+            kept.append((lat, lon))
+            last_px = px
+        kept_upto.append(len(kept))
+    return kept, kept_upto
+
+
+def render_base_map(
+    center_lat: float,
+    center_lon: float,
+    tour_coords: Optional[List[Tuple[float, float]]],
+    width_px: int,
+    height_px: int,
+    zoom: int,
+    draw_line: bool,
+) -> Image.Image:
+    """
+    Renders tiles + tour polyline without a photo marker. With a fixed (tour) center this is
+    identical for every photo, so it is rendered once and markers are drawn on copies.
+    """
+    m = CachedStaticMap(width_px, height_px, url_template="https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+
+    if draw_line and tour_coords and len(tour_coords) >= 2:
+        m.add_line(Line([(lon, lat) for lat, lon in tour_coords], LINE_COLOR, LINE_WIDTH))
+
+    return m.render(zoom=zoom, center=(center_lon, center_lat))
+
+
+def draw_marker_on_base(
+    out_path: Path,
+    base: Image.Image,
+    center_lat: float,
+    center_lon: float,
+    point_coords: Tuple[float, float],
+    zoom: int,
+) -> None:
+    lat, lon = point_coords
+    x = (_lon_to_x(lon, zoom) - _lon_to_x(center_lon, zoom)) * TILE_SIZE + base.width / 2
+    y = (_lat_to_y(lat, zoom) - _lat_to_y(center_lat, zoom)) * TILE_SIZE + base.height / 2
+
+    # Same anti-aliasing as staticmap's CircleMarker: draw on a transparent 2x overlay (width is the
+    # radius there), LANCZOS it down to 1x and composite, so tour maps match the per-photo renders
+    overlay = Image.new("RGBA", (base.width * 2, base.height * 2), (255, 0, 0, 0))
+    x2, y2, r2 = x * 2, y * 2, MARKER_WIDTH
+    ImageDraw.Draw(overlay).ellipse((x2 - r2, y2 - r2, x2 + r2, y2 + r2), fill=MARKER_COLOR)
+    overlay = overlay.resize(base.size, Image.LANCZOS)
+
+    img = base.copy()
+    img.paste(overlay, (0, 0), overlay)
+    img.save(out_path)
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(
         description="Export one static map PNG per GPS-tagged photo, highlighting where it was taken."
@@ -196,6 +375,13 @@ def main() -> int:
         default="photo",
         help="Map centering: photo (center on this photo) | tour (fixed center of entire tour)",
     )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Maps rendered in parallel (default: 1). staticmap already fetches each map's tiles with "
+        "several threads; keep this low to respect the OSM tile usage policy.",
+    )
     args = ap.parse_args()
 
     folder = Path(args.folder).resolve()
@@ -222,38 +408,60 @@ def main() -> int:
         tour_center = None
 
     draw_line = args.line != "none"
+    track, track_upto = simplify_track(all_coords, args.zoom)
 
-    for i, p in enumerate(points):
-        if args.line == "full":
-            tour_coords = all_coords
-        elif args.line == "upto":
-            tour_coords = all_coords[: i + 1]
-        else:
-            tour_coords = None
-
-        if tour_center is not None:
-            center_lat, center_lon = tour_center
-        else:
-            center_lat, center_lon = p.lat, p.lon
-
-        ts = p.dt.strftime("%Y%m%d_%H%M%S")
-        out_name = f"{ts}__{safe_stem(p.path)}__map_{args.width}x{args.height}.png"
-        out_path = out_dir / out_name
-
-        render_map_image(
-            out_path=out_path,
-            center_lat=center_lat,
-            center_lon=center_lon,
-            tour_coords=tour_coords,
-            point_coords=(p.lat, p.lon),
-            width_px=args.width,
-            height_px=args.height,
-            zoom=args.zoom,
-            draw_line=draw_line,
+    # Fixed center and a line that doesn't change per photo: only the marker moves
+    base = None
+    if tour_center is not None and args.line != "upto":
+        base = render_base_map(
+            tour_center[0], tour_center[1], track, args.width, args.height, args.zoom, draw_line
         )
 
-        if (i + 1) % 25 == 0 or (i + 1) == len(points):
-            print(f"Rendered {i+1}/{len(points)}")
+    # Tile fetching is network-bound: render several maps at once (each task has its own StaticMap)
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        futs = []
+        for i, p in enumerate(points):
+            if args.line == "full":
+                tour_coords = track
+            elif args.line == "upto":
+                tour_coords = track[: track_upto[i]]
+            else:
+                tour_coords = None
+
+            if tour_center is not None:
+                center_lat, center_lon = tour_center
+            else:
+                center_lat, center_lon = p.lat, p.lon
+
+            ts = p.dt.strftime("%Y%m%d_%H%M%S")
+            out_name = f"{ts}__{safe_stem(p.path)}__map_{args.width}x{args.height}.png"
+            out_path = out_dir / out_name
+
+            if base is not None:
+                futs.append(
+                    ex.submit(draw_marker_on_base, out_path, base, center_lat, center_lon, (p.lat, p.lon), args.zoom)
+                )
+                continue
+
+            futs.append(
+                ex.submit(
+                    render_map_image,
+                    out_path=out_path,
+                    center_lat=center_lat,
+                    center_lon=center_lon,
+                    tour_coords=tour_coords,
+                    point_coords=(p.lat, p.lon),
+                    width_px=args.width,
+                    height_px=args.height,
+                    zoom=args.zoom,
+                    draw_line=draw_line,
+                )
+            )
+
+        for i, fut in enumerate(as_completed(futs), start=1):
+            fut.result()
+            if i % 25 == 0 or i == len(points):
+                print(f"Rendered {i}/{len(points)}")
 
     print(f"Done. Output folder: {out_dir}")
     return 0
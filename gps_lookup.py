@@ -0,0 +1,80 @@
+"""
+Photo -> GPS map lookup shared by photobook_gps.py and 02_pdf.py.
+
+Map exporter names look like "YYYYMMDD_HHMMSS__<photo_stem>__map_<W>x<H>.png". A GPS folder is
+listed once and indexed, so each lookup is a dict hit instead of a directory listing, while the
+result stays the one a linear scan of the listing would return (first match in listing order).
+"""
+import functools
+import os
+
+GPS_MAP_EXTS = (".png", ".jpg", ".jpeg")
+
+
+@functools.lru_cache(maxsize=16)
+def index_gps_folder(
+    gps_folder: str,
+) -> tuple[dict[str, tuple[int, str]], dict[str, tuple[int, str]], list[tuple[str, str]]]:
+    """
+    One scandir per GPS folder. Returns:
+    - token index: stem -> (listing position, path) for every "__<stem>__map_" in a name
+    - exact index: map file stem -> (listing position, path)
+    - [(lowercase name, path)] listing for the substring fallback
+    Keys are lowercase; the first file in listing order wins. Only regular files are indexed,
+    so a returned path needs no further existence check.
+    """
+    token_index: dict[str, tuple[int, str]] = {}
+    exact_index: dict[str, tuple[int, str]] = {}
+    listing: list[tuple[str, str]] = []
+
+    with os.scandir(gps_folder) as it:
+        for entry in it:
+            name_l = entry.name.lower()
+            if not name_l.endswith(GPS_MAP_EXTS) or not entry.is_file():
+                continue
+            pos = len(listing)
+            listing.append((name_l, entry.path))
+            exact_index.setdefault(os.path.splitext(name_l)[0], (pos, entry.path))
+
+            # every "__<stem>__map_" substring: each "__" before each "__map_" starts a token
+            map_pos = name_l.find("__map_")
+            while map_pos != -1:
+                prefix = name_l[:map_pos]
+                sep = prefix.find("__")
+                while sep != -1:
+                    token_index.setdefault(prefix[sep + 2:], (pos, entry.path))
+                    sep = prefix.find("__", sep + 1)
+                map_pos = name_l.find("__map_", map_pos + 1)
+
+    return token_index, exact_index, listing
+
+
+def find_corresponding_gps_image(photo_path: str, gps_folder: str | None, mode: str = "stem_contains") -> str | None:
+    """
+    Find a GPS map image corresponding to photo_path in gps_folder.
+
+    mode "stem_contains" (default): first map named "...__<stem>__map_...", else the first map
+    whose name contains the stem anywhere. mode "exact": first map whose stem equals the photo's
+    stem or that carries the "__<stem>__map_" token.
+    """
+    if not gps_folder or not os.path.isdir(gps_folder):
+        return None
+
+    stem = os.path.splitext(os.path.basename(photo_path))[0].lower()
+    token_index, exact_index, listing = index_gps_folder(gps_folder)
+
+    hits = [token_index.get(stem)]
+    if mode == "exact":
+        hits.append(exact_index.get(stem))
+    hits = [hit for hit in hits if hit]
+    if hits:
+        # earliest file in listing order, as a linear scan would find it
+        return min(hits)[1]
+
+    if mode != "exact":
+        # fallback: contains stem anywhere
+        for name_l, fp in listing:
+            if stem in name_l:
+                return fp
+
+    return None
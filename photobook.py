@@ -1,16 +1,31 @@
 import os
 import json
 import argparse
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from fpdf import FPDF
-from PIL import Image, ExifTags
+import piexif
+from PIL import Image
 from tqdm import tqdm
-from pdf2image import convert_from_path
+import imagesize
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
+
+try:  # optional: libjpeg-turbo encoder for --turbo (pip install "photobook[turbo]")
+    import numpy as np
+    import simplejpeg
+except ImportError:
+    np = None
+    simplejpeg = None
+
 Image.MAX_IMAGE_PIXELS = None
 import glob
 import math
 
+log = logging.getLogger(__name__)
+
 
 def load_config(config_file):
     """Load configuration from a JSON file."""
@@ -18,67 +33,117 @@ def load_config(config_file):
         return json.load(file)
 
 
+@functools.lru_cache(maxsize=None)
 def get_exif_date_taken(file_path):
-    """Extract the EXIF 'Date Taken' metadata."""
+    """Extract the EXIF 'Date Taken' metadata (header-only read, memoized per path)."""
     try:
-        img = Image.open(file_path)
-        exif = img._getexif()
-        if exif:
-            for tag, value in exif.items():
-                decoded_tag = ExifTags.TAGS.get(tag)
-                if decoded_tag == "DateTimeOriginal":
-                    return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+        try:
+            # piexif seeks straight to the APP1 segment; no Pillow plugin/decoder setup
+            value = piexif.load(file_path)["Exif"].get(piexif.ExifIFD.DateTimeOriginal)
+        except piexif.InvalidImageDataError:
+            # not JPEG/TIFF/WebP (e.g. PNG): let Pillow try
+            with Image.open(file_path) as img:
+                value = img.getexif().get_ifd(0x8769).get(0x9003)
+        if value:
+            if isinstance(value, bytes):
+                value = value.decode("ascii", errors="ignore")
+            return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
     except Exception as e:
-        print(f"Error reading EXIF data from {file_path}: {e}")
+        log.warning("Error reading EXIF data from %s: %s", file_path, e)
     return None
 
 
 def get_image_sort_key(file_path):
-    """Sort images by EXIF date, modified date, or filename."""
+    """
+    Sort key (date, filename): EXIF date, else modified date; files without either sort last.
+    Always the same shape, so keys from different sources compare without TypeError.
+    """
+    name = os.path.basename(file_path).lower()
     exif_date = get_exif_date_taken(file_path)
     if exif_date:
-        return exif_date
+        return exif_date, name
 
     try:
         modified_date = os.path.getmtime(file_path)
-        return datetime.fromtimestamp(modified_date)
+        return datetime.fromtimestamp(modified_date), name
     except Exception as e:
-        print(f"Error getting modified date for {file_path}: {e}")
+        log.warning("Error getting modified date for %s: %s", file_path, e)
 
-    return os.path.basename(file_path).lower()
+    return datetime.max, name
 
 
-def process_image(file_path, resized_folder, max_width, max_height):
-    """Resize, rotate, and upscale an image only if it has not been processed before."""
+def process_image(file_path, resized_folder, max_width, max_height, turbo=False, src_stat=None, resized_exists=None):
+    """Resize, rotate, and upscale an image unless an up-to-date resized copy exists.
+
+    Returns (resized_path, width_px, height_px), so callers don't have to re-open the result.
+    resized_exists=False (known from one scan of resized_folder) skips probing for a cached copy.
+    """
     resized_path = os.path.join(resized_folder, os.path.basename(file_path))
 
-    # Check if the file has already been processed
-    if os.path.exists(resized_path):
-        print(f"Skipping {file_path}, already processed.")
-        return resized_path  # Return existing file path
+    # Check if the file has already been processed (and the source hasn't changed since)
+    dst_stat = None
+    if resized_exists is not False:
+        try:
+            dst_stat = os.stat(resized_path)
+        except FileNotFoundError:
+            pass
+    if dst_stat is not None and dst_stat.st_mtime >= (src_stat or os.stat(file_path)).st_mtime:
+        log.debug("Skipping %s, already processed.", file_path)
+        # Return existing file path; its size comes from the JPEG header
+        return (resized_path, *imagesize.get(resized_path))
 
     try:
         img = Image.open(file_path)
 
-        if img.height > img.width:
-            img = img.rotate(90, expand=True)
-
-        img_width, img_height = img.size
+        # Portrait images are rotated to landscape; sizes below are after that rotation
+        portrait = img.height > img.width
+        img_width, img_height = (img.height, img.width) if portrait else img.size
 
+        # Upscale to cover the box if too small, then fit inside it: one resize to the final size
         if img_width < max_width or img_height < max_height:
             scaling_factor = max(max_width / img_width, max_height / img_height)
-            img = img.resize(
-                (int(img_width * scaling_factor), int(img_height * scaling_factor)), Image.LANCZOS
-            )
+            img_width, img_height = int(img_width * scaling_factor), int(img_height * scaling_factor)
+
+        if img_width > max_width or img_height > max_height:
+            scaling_factor = min(max_width / img_width, max_height / img_height)
+            img_width, img_height = max(round(img_width * scaling_factor), 1), max(round(img_height * scaling_factor), 1)
+
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, keeping at least 2x the final size for
+        # Lanczos (box in source orientation; no-op for non-JPEG)
+        img.draft("RGB", (img_height * 2, img_width * 2) if portrait else (img_width * 2, img_height * 2))
+
+        if portrait:
+            img = img.transpose(Image.Transpose.ROTATE_90)
+
+        if (img_width, img_height) != img.size:
+            img = img.resize((img_width, img_height), Image.LANCZOS)
+
+        is_png = resized_path.lower().endswith(".png")
+        if turbo and simplejpeg is not None and not is_png and img.mode == "RGB":
+            # libjpeg-turbo straight from the pixel buffer; 4:2:0 like Pillow's default
+            with open(resized_path, "wb") as out:
+                out.write(simplejpeg.encode_jpeg(
+                    np.asarray(img), quality=85, colorspace="RGB", colorsubsampling="420", fastdct=True
+                ))
+        elif is_png:
+            img.save(resized_path, format="PNG")
+        else:
+            # optimized Huffman tables + progressive scans: ~20-30% fewer bytes in the PDF
+            img.save(resized_path, format="JPEG", quality=85, optimize=True, progressive=True, subsampling="4:2:0")
+        log.debug("Processed %s -> %s", file_path, resized_path)
+        return (resized_path, *img.size)
+    except Exception as e:
+        log.warning("Error processing %s: %s", file_path, e)
 
-        img.thumbnail((max_width, max_height), Image.LANCZOS)
+    return (resized_path, *imagesize.get(resized_path))
 
-        img.save(resized_path, quality=85)
-        print(f"Processed {file_path} -> {resized_path}")
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
 
-    return resized_path
+def _process_image_to_disk(file_path, src_stat, resized_exists, resized_folder, max_width, max_height, turbo=False):
+    """Pool worker: process_image with the per-file arguments first, as executor.map passes them."""
+    return process_image(
+        file_path, resized_folder, max_width, max_height,
+        turbo=turbo, src_stat=src_stat, resized_exists=resized_exists,
+    )
 
 
 def enhanced_title_page(pdf, config):
@@ -136,16 +201,40 @@ def process_image_for_pdf(image_path, max_width_mm, max_height_mm, allow_rotatio
     Returns:
         tuple: Scaled width and height in millimeters, and the processed image path.
     """
-    img = Image.open(image_path)
     dpi = 300  # Default DPI for PDF scaling (pixels per inch)
-
-    # Rotate the image only if rotation is allowed and the image is in landscape orientation
-    if allow_rotation and img.width > img.height:
-        img = img.rotate(-90, expand=True)
+    # Pixel size that fills the box at that DPI; more resolution never shows up on paper
+    tgt_w_px = int(max_width_mm / 25.4 * dpi)
+    tgt_h_px = int(max_height_mm / 25.4 * dpi)
+
+    with Image.open(image_path) as img:
+        processed_image_path = image_path
+        width, height = img.size
+
+        # Rotate the image only if rotation is allowed and the image is in landscape orientation
+        rotate = allow_rotation and img.width > img.height
+
+        # Otherwise fpdf can embed the original JPEG/PNG as-is, so nothing is re-encoded
+        if rotate or img.format not in ("JPEG", "PNG"):
+            # The box size is part of the name: a copy capped for one box isn't reused for a bigger one
+            processed_image_path = f"{os.path.splitext(image_path)[0]}_processed_{tgt_w_px}x{tgt_h_px}.jpg"
+
+            # Reuse the processed file of an earlier run unless the source changed since
+            if os.path.exists(processed_image_path) and os.path.getmtime(image_path) <= os.path.getmtime(processed_image_path):
+                width, height = imagesize.get(processed_image_path)
+            else:
+                # Re-encoding anyway: decode (draft) and save no more than the box size
+                img.draft("RGB", (tgt_h_px, tgt_w_px) if rotate else (tgt_w_px, tgt_h_px))
+                if rotate:
+                    img = img.transpose(Image.Transpose.ROTATE_270)
+                img.thumbnail((tgt_w_px, tgt_h_px), Image.LANCZOS)
+
+                # Save the rotated (or converted) image to a temporary file
+                img.save(processed_image_path, "JPEG")
+                width, height = img.size
 
     # Convert dimensions from pixels to millimeters
-    img_width_mm = img.width * 25.4 / dpi
-    img_height_mm = img.height * 25.4 / dpi
+    img_width_mm = width * 25.4 / dpi
+    img_height_mm = height * 25.4 / dpi
 
     # Calculate the scaling factor to fit the image within the maximum dimensions
     scaling_factor = min(max_width_mm / img_width_mm, max_height_mm / img_height_mm)
@@ -154,13 +243,19 @@ def process_image_for_pdf(image_path, max_width_mm, max_height_mm, allow_rotatio
     img_width_mm *= scaling_factor
     img_height_mm *= scaling_factor
 
-    # Save the rotated or unmodified image to a temporary file
-    processed_image_path = f"{os.path.splitext(image_path)[0]}_processed.jpg"
-    img.save(processed_image_path, "JPEG")
-
     return img_width_mm, img_height_mm, processed_image_path
 
 
+def fit_in_box(width_px, height_px, box_w_mm, box_h_mm):
+    """Largest (width_mm, height_mm) with the image's aspect ratio that fits the box.
+
+    Converting pixels to mm first (at any DPI) only scales both sides by the same factor, so the
+    fit is computed on the pixel size directly.
+    """
+    scale = min(box_w_mm / width_px, box_h_mm / height_px)
+    return width_px * scale, height_px * scale
+
+
 class CustomPDF(FPDF):
     """Custom PDF class to add page numbering."""
     def header(self):
@@ -174,7 +269,8 @@ class CustomPDF(FPDF):
 
 def compress(pdf_files, dpi, output_path):
     """
-    Convert PDF pages to images, rotating landscape pages to portrait.
+    Convert PDF pages to images. Landscape pages are stored as rendered; they are turned to
+    portrait when placed (see main), which is a PDF transform instead of a 600 DPI pixel copy.
 
     Parameters:
         pdf_files (list): List of PDF file paths to process.
@@ -183,37 +279,69 @@ def compress(pdf_files, dpi, output_path):
     """
     os.makedirs(output_path, exist_ok=True)
 
-    for pdf_file in tqdm(pdf_files, desc="Converting PDFs to images"):
-        keywords = ['DEL', 'DTP']
-        if any(keyword in pdf_file for keyword in keywords):
-            continue
+    keywords = ['DEL', 'DTP']
+    pdf_files = [pdf_file for pdf_file in pdf_files if not any(keyword in pdf_file for keyword in keywords)]
 
-        # Load the PDF and convert to images
-        images = convert_from_path(pdf_file, dpi=math.ceil(dpi))
-                
-        for i, image in enumerate(images):
-            # Rotate landscape images to portrait if needed
-            if image.width > image.height:
-                image = image.rotate(90, expand=True)
+    # One job per page; pdftoppm writes the PNG itself, so threads are enough to keep all cores busy
+    jobs = [
+        (pdf_file, i)
+        for pdf_file in pdf_files
+        for i in range(pdfinfo_from_path(pdf_file)["Pages"])
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(tqdm(
+            executor.map(lambda job: _render_pdf_page(job[0], job[1], dpi, output_path), jobs),
+            total=len(jobs),
+            desc="Converting PDFs to images",
+            unit="page",
+        ))
 
-            # Save the image with an incremental name, include the original PDF name
-            base_name = os.path.splitext(os.path.basename(pdf_file))[0]
-            output_filename = os.path.join(output_path, f"{base_name}_page_{i}.png")
-            image.save(output_filename, 'PNG')
+
+def _render_pdf_page(pdf_file, page_index, dpi, output_path):
+    """Render one PDF page straight to <pdf name>_page_<i>.png (worker for compress).
+
+    pdftoppm encodes the PNG itself (paths_only), so the page never passes through PIL.
+    """
+    base_name = os.path.splitext(os.path.basename(pdf_file))[0]
+    convert_from_path(
+        pdf_file,
+        dpi=math.ceil(dpi),
+        first_page=page_index + 1,
+        last_page=page_index + 1,
+        output_folder=output_path,
+        output_file=f"{base_name}_page_{page_index}",
+        single_file=True,
+        fmt="png",
+        paths_only=True,
+    )
 
 
 def main():
     parser = argparse.ArgumentParser(description="Create a photobook from image folders.")
     parser.add_argument("config", type=str, help="Path to the JSON configuration file.")
+    parser.add_argument(
+        "--turbo",
+        action="store_true",
+        help="Encode resized JPEGs with simplejpeg/libjpeg-turbo (falls back to Pillow if not installed)",
+    )
     args = parser.parse_args()
 
+    # Per-image messages go through logging (stderr, warnings only) instead of a print per image
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
     config = load_config(args.config)
 
+    if args.turbo and simplejpeg is None:
+        print("--turbo: simplejpeg/numpy not installed, using Pillow encoder")
+
     output_pdf = os.path.join(config["output_folder"], "Photobook.pdf")
     resized_folder = os.path.join(config["output_folder"], "Resized_Images")
     pdf_image_folder = os.path.join(config["output_folder"], "PDF_Images")
 
     os.makedirs(resized_folder, exist_ok=True)
+    # One scan of the resize cache instead of a stat per image to find out what is already there
+    with os.scandir(resized_folder) as it:
+        resized_set = {entry.name for entry in it}
 
     pdf = CustomPDF("P", "mm", "A4")
     pdf.set_auto_page_break(auto=False)
@@ -225,29 +353,40 @@ def main():
     for folder_path, heading, thumbnail in config["input_folders"]:
         chapter_page(pdf, heading, os.path.join(folder_path, thumbnail))
 
-        image_files = [
-            os.path.join(folder_path, file)
-            for file in os.listdir(folder_path)
-            if os.path.isfile(os.path.join(folder_path, file)) and file.lower().endswith(('.jpg', '.jpeg', '.png'))
-        ]
+        with os.scandir(folder_path) as it:
+            src_stats = {
+                entry.path: entry.stat()
+                for entry in it
+                if entry.is_file() and entry.name.lower().endswith(('.jpg', '.jpeg', '.png'))
+            }
+        image_files = list(src_stats)
         #sorted_images = sorted(image_files, key=get_image_sort_key)
         sorted_images = sorted(image_files, key=lambda x: os.path.basename(x).lower())
 
-        for i in tqdm(range(0, len(sorted_images), 2), desc=f"Processing chapter '{heading}'", unit="page"):
+        # Resize the whole chapter on all cores first; the layout loop only places the results
+        resize = functools.partial(
+            _process_image_to_disk, resized_folder=resized_folder, max_width=2480, max_height=3508, turbo=args.turbo
+        )
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            resized = list(tqdm(
+                executor.map(
+                    resize,
+                    sorted_images,
+                    [src_stats[p] for p in sorted_images],
+                    [os.path.basename(p) in resized_set for p in sorted_images],
+                ),
+                total=len(sorted_images),
+                desc=f"Resizing chapter '{heading}'",
+                unit="img",
+            ))
+        resized_set.update(os.path.basename(p) for p in sorted_images)
+
+        positions = [(15, 15), (15, 150)]
+        for i in tqdm(range(0, len(resized), 2), desc=f"Processing chapter '{heading}'", unit="page"):
             pdf.add_page()
-            positions = [(15, 15), (15, 150)]
-            for j, file_path in enumerate(sorted_images[i:i + 2]):
-                resized_path = process_image(file_path, resized_folder, 2480, 3508)
-                img = Image.open(resized_path)
-                img_width_mm = img.width * 25.4 / 300
-                img_height_mm = img.height * 25.4 / 300
-
-                scaling_factor = min(180 / img_width_mm, 130 / img_height_mm)
-                img_width_mm *= scaling_factor
-                img_height_mm *= scaling_factor
-
-                x, y = positions[j]
-                pdf.image(resized_path, x=x, y=y, w=img_width_mm, h=img_height_mm)
+            for (x, y), (image_src, width_px, height_px) in zip(positions, resized[i:i + 2]):
+                img_width_mm, img_height_mm = fit_in_box(width_px, height_px, 180, 130)
+                pdf.image(image_src, x=x, y=y, w=img_width_mm, h=img_height_mm)
 
     # Compress and append additional PDFs as images
     if "append_pdfs" in config:
@@ -258,11 +397,17 @@ def main():
             
             b, ext = os.path.splitext(image_file)
             p = os.path.join(pdf_image_folder, os.path.basename(b) + '_page_0.png')
-            img = Image.open(p)
+            # Only the size is needed: read it from the PNG header
+            img_width_px, img_height_px = imagesize.get(p)
+
+            # Landscape pages are placed rotated to portrait: lay out with swapped dimensions
+            landscape = img_width_px > img_height_px
+            if landscape:
+                img_width_px, img_height_px = img_height_px, img_width_px
 
             # Convert image dimensions from pixels to millimeters (assuming 300 DPI)
-            img_width_mm = img.width * 25.4 / 300
-            img_height_mm = img.height * 25.4 / 300
+            img_width_mm = img_width_px * 25.4 / 300
+            img_height_mm = img_height_px * 25.4 / 300
 
             # Calculate scaling factor to fit image within the A4 page size (210mm x 297mm) with margins
             max_width_mm = 180  # Max width with margins
@@ -278,7 +423,14 @@ def main():
             y_centered = (297 - scaled_height_mm) / 2
 
             # Add the image to the PDF
-            pdf.image(p, x=x_centered, y=y_centered, w=scaled_width_mm, h=scaled_height_mm)
+            if landscape:
+                # rotate the unrotated render 90° counter-clockwise about the page center
+                with pdf.rotation(90, x=105, y=148.5):
+                    pdf.image(
+                        p, x=105 - scaled_height_mm / 2, y=148.5 - scaled_width_mm / 2, w=scaled_height_mm, h=scaled_width_mm
+                    )
+            else:
+                pdf.image(p, x=x_centered, y=y_centered, w=scaled_width_mm, h=scaled_height_mm)
 
     pdf.output(output_pdf)
     print(f"Final Photobook created and saved as PDF: {output_pdf}")
@@ -1,16 +1,35 @@
 import os
 import json
 import argparse
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import math
+import queue
+import re
+import threading
 
 from fpdf import FPDF
-from PIL import Image, ExifTags
+import imagesize
+import piexif
+from PIL import Image
 from tqdm import tqdm
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from gps_lookup import find_corresponding_gps_image
+
+try:  # optional: libjpeg-turbo encoder for --turbo (pip install "photobook[turbo]")
+    import numpy as np
+    import simplejpeg
+except ImportError:
+    np = None
+    simplejpeg = None
 
 Image.MAX_IMAGE_PIXELS = None
 
+log = logging.getLogger(__name__)
+
 
 def load_config(config_file: str) -> dict:
     """Load configuration from a JSON file."""
@@ -18,87 +37,193 @@ def load_config(config_file: str) -> dict:
         return json.load(file)
 
 
+# EXIF header reads are I/O-bound, so threads overlap them well
+SORT_KEY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+# photo rows read ahead of the PDF embedding loop
+PDF_PREFETCH = 16
+
+# (IFD, tag) in preferred order: DateTimeOriginal -> DateTimeDigitized -> DateTime
+EXIF_DATE_TAGS = (
+    ("Exif", piexif.ExifIFD.DateTimeOriginal),
+    ("Exif", piexif.ExifIFD.DateTimeDigitized),
+    ("0th", piexif.ImageIFD.DateTime),
+)
+
+
+@functools.lru_cache(maxsize=None)
 def get_exif_date_taken(file_path: str) -> datetime | None:
     """
     Extract a robust EXIF datetime in preferred order:
     DateTimeOriginal -> DateTimeDigitized -> DateTime
+
+    Header-only read via piexif (Pillow fallback for e.g. PNG), memoized per path.
     """
     try:
-        img = Image.open(file_path)
-        exif = img._getexif()
-        if not exif:
-            return None
-
-        # Build tag->value map with decoded names
-        decoded = {}
-        for tag, value in exif.items():
-            decoded_tag = ExifTags.TAGS.get(tag, tag)
-            decoded[decoded_tag] = value
-
-        for key in ("DateTimeOriginal", "DateTimeDigitized", "DateTime"):
-            value = decoded.get(key)
+        try:
+            exif = piexif.load(file_path)
+            values = [exif[ifd].get(tag) for ifd, tag in EXIF_DATE_TAGS]
+        except piexif.InvalidImageDataError:
+            with Image.open(file_path) as img:
+                exif = img.getexif()
+                exif_ifd = exif.get_ifd(0x8769)
+                values = [exif_ifd.get(0x9003), exif_ifd.get(0x9004), exif.get(0x0132)]
+
+        for value in values:
             if value:
+                if isinstance(value, bytes):
+                    value = value.decode("ascii", errors="ignore")
                 try:
                     return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
                 except Exception:
                     pass
     except Exception as e:
-        print(f"Error reading EXIF data from {file_path}: {e}")
+        log.warning("Error reading EXIF data from %s: %s", file_path, e)
 
     return None
 
 
-def get_image_sort_key(file_path: str):
-    """Sort images by EXIF date, then modified date, then filename."""
-    exif_date = get_exif_date_taken(file_path)
-    if exif_date:
-        return exif_date
+# {path: [mtime_ns, size, iso date or None]}, persisted as <output_folder>/.exif_cache.json
+EXIF_CACHE_NAME = ".exif_cache.json"
+_exif_date_cache: dict[str, list] = {}
 
+
+def load_exif_cache(cache_path: str) -> None:
+    """Load EXIF dates of a previous run; a missing or unreadable cache just starts empty."""
     try:
-        modified_date = os.path.getmtime(file_path)
-        return datetime.fromtimestamp(modified_date)
-    except Exception as e:
-        print(f"Error getting modified date for {file_path}: {e}")
+        with open(cache_path, "r", encoding="utf8") as file:
+            _exif_date_cache.update(json.load(file))
+    except (OSError, ValueError):
+        pass
+
 
-    return os.path.basename(file_path).lower()
+def save_exif_cache(cache_path: str) -> None:
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf8") as file:
+        json.dump(_exif_date_cache, file)
+    os.replace(tmp_path, cache_path)
 
 
-def process_image(file_path: str, resized_folder: str, max_width_px: int, max_height_px: int) -> str:
+def _cached_exif_date(file_path: str, st: os.stat_result) -> datetime | None:
+    entry = _exif_date_cache.get(file_path)
+    if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return datetime.fromisoformat(entry[2]) if entry[2] else None
+
+    exif_date = get_exif_date_taken(file_path)
+    _exif_date_cache[file_path] = [st.st_mtime_ns, st.st_size, exif_date.isoformat() if exif_date else None]
+    return exif_date
+
+
+def get_image_sort_key(file_path: str, st: os.stat_result | None = None) -> tuple[datetime, str]:
+    """
+    Sort key (date, filename): EXIF date, else modified date; files without either sort last.
+    Always the same shape, so keys from different sources compare without TypeError.
+    EXIF dates are reused from the sidecar cache while the file's mtime and size are unchanged.
+    Pass st (e.g. DirEntry.stat() from the directory scan) to skip the stat call.
+    """
+    name = os.path.basename(file_path).lower()
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            log.warning("Error getting modified date for %s: %s", file_path, e)
+            return get_exif_date_taken(file_path) or datetime.max, name
+
+    exif_date = _cached_exif_date(file_path, st)
+    if exif_date:
+        return exif_date, name
+
+    return datetime.fromtimestamp(st.st_mtime), name
+
+
+def process_image(
+    file_path: str,
+    resized_folder: str,
+    max_width_px: int,
+    max_height_px: int,
+    turbo: bool = False,
+    src_stat: os.stat_result | None = None,
+    resized_exists: bool | None = None,
+) -> tuple[str, int, int]:
     """
-    Resize/rotate/upscale an image only if it has not been processed before.
+    Resize/rotate/upscale an image unless an up-to-date resized copy exists (src_stat saves a stat
+    when the caller already has it from the directory scan; resized_exists=False, from a single scan
+    of resized_folder, skips probing for a cached copy that isn't there).
     Keeps your original behavior: rotate portrait to landscape (so pages are landscape-ish images).
+    Returns (resized_path, width_px, height_px) so callers don't have to re-open the result.
     """
     os.makedirs(resized_folder, exist_ok=True)
     resized_path = os.path.join(resized_folder, os.path.basename(file_path))
 
-    if os.path.exists(resized_path):
-        return resized_path
+    dst_stat = None
+    if resized_exists is not False:
+        try:
+            dst_stat = os.stat(resized_path)
+        except FileNotFoundError:
+            pass
+    if dst_stat is not None and dst_stat.st_mtime >= (src_stat or os.stat(file_path)).st_mtime:
+        # Already processed: read the size from the JPEG header only
+        return (resized_path, *imagesize.get(resized_path))
 
     try:
         img = Image.open(file_path)
 
-        # Your original behavior: rotate if portrait
-        if img.height > img.width:
-            img = img.rotate(90, expand=True)
+        # Your original behavior: rotate if portrait (sizes below are after that rotation)
+        portrait = img.height > img.width
+        img_width, img_height = (img.height, img.width) if portrait else img.size
 
-        img_width, img_height = img.size
-
-        # Upscale if too small
+        # Upscale if too small (to cover the box) ...
         if img_width < max_width_px or img_height < max_height_px:
             scaling_factor = max(max_width_px / img_width, max_height_px / img_height)
-            img = img.resize(
-                (int(img_width * scaling_factor), int(img_height * scaling_factor)),
-                Image.LANCZOS,
-            )
+            img_width, img_height = int(img_width * scaling_factor), int(img_height * scaling_factor)
+
+        # ... then downscale to fit max; both folded into a single Lanczos pass
+        if img_width > max_width_px or img_height > max_height_px:
+            scaling_factor = min(max_width_px / img_width, max_height_px / img_height)
+            img_width, img_height = max(round(img_width * scaling_factor), 1), max(round(img_height * scaling_factor), 1)
+
+        # Shrink-on-load: libjpeg decodes at 1/2, 1/4 or 1/8 scale while still keeping 2x the
+        # final size for Lanczos (box in source orientation; no-op for non-JPEG)
+        img.draft("RGB", (img_height * 2, img_width * 2) if portrait else (img_width * 2, img_height * 2))
+
+        if portrait:
+            img = img.transpose(Image.Transpose.ROTATE_90)
+
+        if (img_width, img_height) != img.size:
+            img = img.resize((img_width, img_height), Image.LANCZOS)
+
+        is_png = resized_path.lower().endswith(".png")
+        if turbo and simplejpeg is not None and not is_png and img.mode == "RGB":
+            # libjpeg-turbo straight from the pixel buffer; 4:2:0 like Pillow's default
+            with open(resized_path, "wb") as out:
+                out.write(simplejpeg.encode_jpeg(
+                    np.asarray(img), quality=85, colorspace="RGB", colorsubsampling="420", fastdct=True
+                ))
+        elif is_png:
+            img.save(resized_path, format="PNG")
+        else:
+            # optimized Huffman tables + progressive scans: ~20-30% fewer bytes in the PDF
+            img.save(resized_path, format="JPEG", quality=85, optimize=True, progressive=True, subsampling="4:2:0")
+        return (resized_path, *img.size)
+    except Exception as e:
+        log.warning("Error processing %s: %s", file_path, e)
 
-        # Downscale to fit max
-        img.thumbnail((max_width_px, max_height_px), Image.LANCZOS)
+    return (resized_path, *imagesize.get(resized_path))
 
-        img.save(resized_path, quality=85)
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
 
-    return resized_path
+def _process_image_to_disk(
+    file_path: str,
+    src_stat: os.stat_result,
+    resized_exists: bool | None,
+    resized_folder: str,
+    max_width_px: int,
+    max_height_px: int,
+    turbo: bool = False,
+) -> tuple[str, int, int]:
+    """Pool worker: process_image with the per-file arguments first, as executor.map passes them."""
+    return process_image(
+        file_path, resized_folder, max_width_px, max_height_px,
+        turbo=turbo, src_stat=src_stat, resized_exists=resized_exists,
+    )
 
 
 def process_image_for_pdf(image_path: str, max_width_mm: float, max_height_mm: float, allow_rotation: bool = True):
@@ -109,25 +234,48 @@ def process_image_for_pdf(image_path: str, max_width_mm: float, max_height_mm: f
     Returns:
         (img_width_mm, img_height_mm, processed_image_path)
     """
-    img = Image.open(image_path)
     dpi = 300  # scaling assumption
-
-    if allow_rotation and img.width > img.height:
-        img = img.rotate(-90, expand=True)
-
-    img_width_mm = img.width * 25.4 / dpi
-    img_height_mm = img.height * 25.4 / dpi
+    # pixels that fill the box at that dpi; anything beyond never shows up on paper
+    tgt_w_px = int(max_width_mm / 25.4 * dpi)
+    tgt_h_px = int(max_height_mm / 25.4 * dpi)
+
+    with Image.open(image_path) as img:
+        processed_image_path = image_path
+        width, height = img.size
+        rotate = allow_rotation and img.width > img.height
+
+        # fpdf embeds JPEG/PNG as-is: only write a _processed_<W>x<H>.jpg if pixels change (or format needs it)
+        if rotate or img.format not in ("JPEG", "PNG"):
+            # box size in the name: a copy capped for one box is never reused for a bigger one
+            processed_image_path = f"{os.path.splitext(image_path)[0]}_processed_{tgt_w_px}x{tgt_h_px}.jpg"
+            if os.path.exists(processed_image_path) and os.path.getmtime(image_path) <= os.path.getmtime(processed_image_path):
+                # written by an earlier run from the same source: reuse it
+                width, height = imagesize.get(processed_image_path)
+            else:
+                # re-encoding anyway: decode (draft) and save at most the box size, not the full photo
+                img.draft("RGB", (tgt_h_px, tgt_w_px) if rotate else (tgt_w_px, tgt_h_px))
+                if rotate:
+                    img = img.transpose(Image.Transpose.ROTATE_270)
+                img.thumbnail((tgt_w_px, tgt_h_px), Image.LANCZOS)
+                img.save(processed_image_path, "JPEG")
+                width, height = img.size
+
+    img_width_mm = width * 25.4 / dpi
+    img_height_mm = height * 25.4 / dpi
 
     scaling_factor = min(max_width_mm / img_width_mm, max_height_mm / img_height_mm)
     img_width_mm *= scaling_factor
     img_height_mm *= scaling_factor
 
-    processed_image_path = f"{os.path.splitext(image_path)[0]}_processed.jpg"
-    img.save(processed_image_path, "JPEG")
-
     return img_width_mm, img_height_mm, processed_image_path
 
 
+def fit_in_box(width_px: int, height_px: int, box_w_mm: float, box_h_mm: float) -> tuple[float, float]:
+    """Largest (w_mm, h_mm) with the image's aspect ratio that fits the box (the px->mm dpi cancels out)."""
+    scale = min(box_w_mm / width_px, box_h_mm / height_px)
+    return width_px * scale, height_px * scale
+
+
 class CustomPDF(FPDF):
     """Custom PDF class to add page numbering."""
     def header(self):
@@ -179,83 +327,149 @@ def chapter_page(pdf: CustomPDF, chapter: str, thumbnail: str | None):
 
 def compress(pdf_files: list[str], dpi: int, output_path: str):
     """
-    Convert PDF pages to images, rotating landscape pages to portrait.
+    Convert PDF pages to images. Landscape pages are stored as rendered; they are turned to
+    portrait when placed (see main), which is a PDF transform instead of a 600 DPI pixel copy.
     """
     os.makedirs(output_path, exist_ok=True)
 
-    for pdf_file in tqdm(pdf_files, desc="Converting PDFs to images"):
-        keywords = ["DEL", "DTP"]
-        if any(keyword in pdf_file for keyword in keywords):
-            continue
+    keywords = ["DEL", "DTP"]
+    pdf_files = [pdf_file for pdf_file in pdf_files if not any(keyword in pdf_file for keyword in keywords)]
+
+    # One job per page; pdftoppm writes the PNG itself, so threads are enough to keep all cores busy
+    jobs = [
+        (pdf_file, i)
+        for pdf_file in pdf_files
+        for i in range(pdfinfo_from_path(pdf_file)["Pages"])
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(tqdm(
+            executor.map(lambda job: _render_pdf_page(job[0], job[1], dpi, output_path), jobs),
+            total=len(jobs),
+            desc="Converting PDFs to images",
+            unit="page",
+        ))
+
+
+def _render_pdf_page(pdf_file: str, page_index: int, dpi: int, output_path: str) -> None:
+    """
+    Render one PDF page straight to <pdf name>_page_<i>.png. pdftoppm encodes the PNG itself
+    (paths_only), so the 600 DPI page never passes through PIL.
+    """
+    base_name = os.path.splitext(os.path.basename(pdf_file))[0]
+    convert_from_path(
+        pdf_file,
+        dpi=math.ceil(dpi),
+        first_page=page_index + 1,
+        last_page=page_index + 1,
+        output_folder=output_path,
+        output_file=f"{base_name}_page_{page_index}",
+        single_file=True,
+        fmt="png",
+        paths_only=True,
+    )
 
-        images = convert_from_path(pdf_file, dpi=math.ceil(dpi))
 
-        for i, image in enumerate(images):
-            if image.width > image.height:
-                image = image.rotate(90, expand=True)
+# Map exporter names end in the map's pixel size: "..._<W>x<H>.png"
+GPS_MAP_SIZE_RE = re.compile(r"_(\d+)x(\d+)\.(?:png|jpg|jpeg)$")
 
-            base_name = os.path.splitext(os.path.basename(pdf_file))[0]
-            output_filename = os.path.join(output_path, f"{base_name}_page_{i}.png")
-            image.save(output_filename, "PNG")
 
+def gps_image_size(gps_path: str) -> tuple[int, int]:
+    """Pixel size of a GPS map: parsed from the exporter's file name, else read from the header."""
+    m = GPS_MAP_SIZE_RE.search(gps_path.lower())
+    if m:
+        return int(m[1]), int(m[2])
+    return imagesize.get(gps_path)
 
-def find_corresponding_gps_image(photo_path: str, gps_folder: str | None, mode: str = "stem_contains") -> str | None:
-    """
-    Find a GPS map image corresponding to photo_path in gps_folder.
 
-    For your map exporter naming like:
-      YYYYMMDD_HHMMSS__<photo_stem>__map_400x1200.png
-    this finds it by token "__<stem>__map_".
+def gps_map_as_jpeg(gps_path: str, jpeg_folder: str) -> str:
     """
-    if not gps_folder:
-        return None
-    if not os.path.isdir(gps_folder):
-        return None
-
-    stem = os.path.splitext(os.path.basename(photo_path))[0].lower()
-
-    # collect candidates once per call (fast enough for typical sets; can be indexed if needed)
-    for fn in os.listdir(gps_folder):
-        if not fn.lower().endswith((".png", ".jpg", ".jpeg")):
-            continue
-
-        name_l = fn.lower()
-        fp = os.path.join(gps_folder, fn)
-
-        if mode == "exact":
-            if os.path.splitext(fn)[0].lower() == stem:
-                return fp
-
-        # default: stem_contains
-        token = f"__{stem}__map_"
-        if token in name_l:
-            return fp
-
-    if mode != "exact":
-        # fallback: contains stem anywhere
-        for fn in os.listdir(gps_folder):
-            if not fn.lower().endswith((".png", ".jpg", ".jpeg")):
-                continue
-            name_l = fn.lower()
-            if stem in name_l:
-                return os.path.join(gps_folder, fn)
+    fpdf embeds JPEGs as-is (DCTDecode) but has to decode and re-deflate every PNG, so PNG maps
+    are converted to a JPEG copy once (reused while newer than the PNG). JPEG maps pass through.
+    """
+    if not gps_path.lower().endswith(".png"):
+        return gps_path
 
-    return None
+    jpeg_path = os.path.join(jpeg_folder, os.path.splitext(os.path.basename(gps_path))[0] + ".jpg")
+    if os.path.exists(jpeg_path) and os.path.getmtime(gps_path) <= os.path.getmtime(jpeg_path):
+        return jpeg_path
+
+    os.makedirs(jpeg_folder, exist_ok=True)
+    with Image.open(gps_path) as img:
+        img.convert("RGB").save(jpeg_path, "JPEG", quality=92)
+    return jpeg_path
+
+
+def prefetched(items, prepare, maxsize: int = PDF_PREFETCH):
+    """
+    Yield prepare(item) for each item, in order, computed on a background thread that runs at most
+    maxsize results ahead (bounded queue, None sentinel). Lets GPS lookups and PNG->JPEG map
+    conversions overlap with the single-threaded pdf.image calls of the consumer.
+    Exceptions from prepare are re-raised here.
+    """
+    q: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def producer() -> None:
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                q.put((prepare(item), None))
+        except Exception as e:
+            q.put((None, e))
+            return
+        q.put(None)
+
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while (entry := q.get()) is not None:
+            value, error = entry
+            if error is not None:
+                raise error
+            yield value
+    finally:
+        # consumer stopped early (e.g. pdf.image raised): free the queue so a producer blocked on
+        # put() wakes up, sees stop and exits instead of idling for the rest of the run
+        stop.set()
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
 
 
 def main():
     parser = argparse.ArgumentParser(description="Create a photobook from image folders (2 images per page) + optional GPS maps.")
     parser.add_argument("config", type=str, help="Path to the JSON configuration file.")
+    parser.add_argument(
+        "--turbo",
+        action="store_true",
+        help="Encode resized JPEGs with simplejpeg/libjpeg-turbo (falls back to Pillow if not installed)",
+    )
     args = parser.parse_args()
 
+    # per-image errors go to stderr via logging; tqdm's bars and the summary stay on their own streams
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
     config = load_config(args.config)
 
+    if args.turbo and simplejpeg is None:
+        print("--turbo: simplejpeg/numpy not installed, using Pillow encoder")
+
     output_folder = config["output_folder"]
     os.makedirs(output_folder, exist_ok=True)
 
     output_pdf = os.path.join(output_folder, "Photobook.pdf")
     resized_folder = os.path.join(output_folder, "Resized_Images")
     pdf_image_folder = os.path.join(output_folder, "PDF_Images")
+    gps_jpeg_folder = os.path.join(output_folder, "GPS_JPEG")
+    exif_cache_path = os.path.join(output_folder, EXIF_CACHE_NAME)
+    load_exif_cache(exif_cache_path)
+
+    # One scan of the resize cache instead of a stat per image to find out what is already there
+    os.makedirs(resized_folder, exist_ok=True)
+    with os.scandir(resized_folder) as it:
+        resized_set = {entry.name for entry in it}
 
     gps_folder = config.get("gps_image_folder")
     gps_match = config.get("gps_match", "stem_contains")
@@ -281,57 +495,77 @@ def main():
 
     row_h = (usable_h - gutter_y) / 2
     row_ys = [margin_y, margin_y + row_h + gutter_y]
+    x_right = margin_x + left_col_w + gutter_x
 
     # Process chapters
     for folder_path, heading, thumb_rel in config["input_folders"]:
         chapter_thumb = os.path.join(folder_path, thumb_rel) if thumb_rel else None
         chapter_page(pdf, heading, chapter_thumb)
 
-        image_files = [
-            os.path.join(folder_path, file)
-            for file in os.listdir(folder_path)
-            if os.path.isfile(os.path.join(folder_path, file)) and file.lower().endswith((".jpg", ".jpeg", ".png"))
-        ]
-
-        # Sort by EXIF date (fallback mtime), stable tie-break by filename
-        sorted_images = sorted(image_files, key=lambda p: (get_image_sort_key(p), os.path.basename(p).lower()))
-
-        for i in tqdm(range(0, len(sorted_images), 2), desc=f"Processing chapter '{heading}'", unit="page"):
-            pdf.add_page()
-            pair = sorted_images[i:i + 2]
-
-            for row_idx, file_path in enumerate(pair):
-                y_row = row_ys[row_idx]
-
-                # LEFT: photo
-                resized_path = process_image(file_path, resized_folder, 2480, 3508)
-                img = Image.open(resized_path)
-                img_w_mm = img.width * 25.4 / 300
-                img_h_mm = img.height * 25.4 / 300
-
-                scale_left = min(left_col_w / img_w_mm, row_h / img_h_mm)
-                w_left = img_w_mm * scale_left
-                h_left = img_h_mm * scale_left
-
-                x_left = margin_x
-                y_left = y_row + (row_h - h_left) / 2
-                pdf.image(resized_path, x=x_left, y=y_left, w=w_left, h=h_left)
-
-                # RIGHT: gps map (if exists)
-                gps_path = find_corresponding_gps_image(file_path, gps_folder, mode=gps_match)
-                if gps_path and os.path.isfile(gps_path):
-                    gps_img = Image.open(gps_path)
-                    gps_w_mm = gps_img.width * 25.4 / 300
-                    gps_h_mm = gps_img.height * 25.4 / 300
-
-                    # No rotation for GPS maps; they are pre-rendered (e.g., 400x1200)
-                    scale_right = min(right_col_w / gps_w_mm, row_h / gps_h_mm)
-                    w_right = gps_w_mm * scale_right
-                    h_right = gps_h_mm * scale_right
-
-                    x_right = margin_x + left_col_w + gutter_x
-                    y_right = y_row + (row_h - h_right) / 2
-                    pdf.image(gps_path, x=x_right, y=y_right, w=w_right, h=h_right)
+        with os.scandir(folder_path) as it:
+            src_stats = {
+                entry.path: entry.stat()
+                for entry in it
+                if entry.is_file() and entry.name.lower().endswith((".jpg", ".jpeg", ".png"))
+            }
+        image_files = list(src_stats)
+
+        # Sort by EXIF date (fallback mtime), stable tie-break by filename.
+        # Keys (date, name) are computed once per file in one parallel pass, then sorted
+        # together with the paths.
+        with ThreadPoolExecutor(max_workers=SORT_KEY_WORKERS) as executor:
+            sort_keys = list(executor.map(get_image_sort_key, image_files, src_stats.values()))
+        sorted_images = [p for _, p in sorted(zip(sort_keys, image_files))]
+
+        # Resize/rotate all photos of the chapter on all cores before the (single-threaded) layout
+        resize = functools.partial(
+            _process_image_to_disk, resized_folder=resized_folder, max_width_px=2480, max_height_px=3508, turbo=args.turbo
+        )
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            resized = list(tqdm(
+                executor.map(
+                    resize,
+                    sorted_images,
+                    [src_stats[p] for p in sorted_images],
+                    [os.path.basename(p) in resized_set for p in sorted_images],
+                ),
+                total=len(sorted_images),
+                desc=f"Resizing chapter '{heading}'",
+                unit="img",
+            ))
+        resized_set.update(os.path.basename(p) for p in sorted_images)
+
+        def prepare_gps(file_path):
+            """Runs on the prefetch thread: map lookup and (first run only) PNG->JPEG conversion."""
+            gps_path = find_corresponding_gps_image(file_path, gps_folder, mode=gps_match)
+            if not gps_path:
+                return None
+            # size parsed from "..._<W>x<H>.png", no decode
+            return (gps_map_as_jpeg(gps_path, gps_jpeg_folder), *gps_image_size(gps_path))
+
+        # fpdf gets file paths: it reads each file once itself and keys the image by name
+        rows = zip(resized, prefetched(sorted_images, prepare_gps))
+        for i, ((image_src, width_px, height_px), gps) in enumerate(
+            tqdm(rows, total=len(sorted_images), desc=f"Processing chapter '{heading}'", unit="img")
+        ):
+            row_idx = i % 2
+            if row_idx == 0:
+                pdf.add_page()
+            y_row = row_ys[row_idx]
+
+            # LEFT: photo
+            w_left, h_left = fit_in_box(width_px, height_px, left_col_w, row_h)
+            y_left = y_row + (row_h - h_left) / 2
+            pdf.image(image_src, x=margin_x, y=y_left, w=w_left, h=h_left)
+
+            # RIGHT: gps map (if exists)
+            if gps:
+                gps_src, gps_w_px, gps_h_px = gps
+
+                # No rotation for GPS maps; they are pre-rendered (e.g., 400x1200)
+                w_right, h_right = fit_in_box(gps_w_px, gps_h_px, right_col_w, row_h)
+                y_right = y_row + (row_h - h_right) / 2
+                pdf.image(gps_src, x=x_right, y=y_right, w=w_right, h=h_right)
 
     # Append additional PDFs as images (optional)
     if "append_pdfs" in config and config["append_pdfs"]:
@@ -347,9 +581,15 @@ def main():
             if not os.path.isfile(p):
                 continue
 
-            img = Image.open(p)
-            img_width_mm = img.width * 25.4 / 300
-            img_height_mm = img.height * 25.4 / 300
+            # Only the size is needed: read it from the PNG header
+            img_width_px, img_height_px = imagesize.get(p)
+
+            # Landscape pages are placed rotated to portrait: lay out with swapped dimensions
+            landscape = img_width_px > img_height_px
+            if landscape:
+                img_width_px, img_height_px = img_height_px, img_width_px
+            img_width_mm = img_width_px * 25.4 / 300
+            img_height_mm = img_height_px * 25.4 / 300
 
             max_width_mm = 180
             max_height_mm = 270
@@ -361,11 +601,20 @@ def main():
             x_centered = (210 - scaled_width_mm) / 2
             y_centered = (297 - scaled_height_mm) / 2
 
-            pdf.image(p, x=x_centered, y=y_centered, w=scaled_width_mm, h=scaled_height_mm)
+            if landscape:
+                # rotate the unrotated render 90° counter-clockwise about the page center
+                with pdf.rotation(90, x=105, y=148.5):
+                    pdf.image(
+                        p, x=105 - scaled_height_mm / 2, y=148.5 - scaled_width_mm / 2, w=scaled_height_mm, h=scaled_width_mm
+                    )
+            else:
+                pdf.image(p, x=x_centered, y=y_centered, w=scaled_width_mm, h=scaled_height_mm)
 
     pdf.output(output_pdf)
     print(f"Final Photobook created and saved as PDF: {output_pdf}")
 
+    save_exif_cache(exif_cache_path)
+
 
 if __name__ == "__main__":
     main()